@@ -9,5 +9,8 @@ class DummyTransaction(object):
     def write(self, value):
         self._chunks.append(value)
 
+    def clear(self):
+        del self._chunks[:]
+
     def getvalue(self):
         return ''.join(self._chunks)
@@ -2,7 +2,12 @@
 
 NameMapper is what looks up variables in cheetah's "searchList".
 """
+import collections
+import contextlib
+import itertools
 import sys
+import threading
+import timeit
 
 import _cheetah
 import six
@@ -12,11 +17,104 @@ NotFound = _cheetah.NotFound
 
 _NOTFOUND = object()
 
+Reads = collections.namedtuple('Reads', ['self_names', 'namespace_names'])
+
+_tracking = threading.local()
+
+
+@contextlib.contextmanager
+def tracking_reads():
+    """Records the names the NameMapper reads in this thread: the names
+    resolved from `self` and the names looked up (found or not) in the
+    namespace.  Nested tracking also records into the outer `Reads`.
+
+        with tracking_reads() as reads:
+            template.respond()
+        reads.self_names, reads.namespace_names
+    """
+    reads = Reads(set(), set())
+    prev = _cheetah.set_tracked_reads(reads)
+    _tracking.reads = reads
+    try:
+        yield reads
+    finally:
+        _cheetah.set_tracked_reads(prev)
+        _tracking.reads = prev
+        if prev is not None:
+            prev.self_names.update(reads.self_names)
+            prev.namespace_names.update(reads.namespace_names)
+
+
+class LazyNamespace(dict):
+    """A namespace whose `lazy` values are computed on their first lookup,
+    for values templates may not display:
+
+        LazyNamespace({'user': user}, lazy={'reviews': get_reviews})
+
+    :param values: Mapping / iterable of items of the computed values.
+    :param lazy: Mapping of names to functions (taking no arguments)
+        computing their values.  A function is called once, its value is
+        then looked up like the computed values.  The seconds spent in each
+        function are recorded in `timings`.
+    """
+
+    def __init__(self, values=(), lazy=()):
+        super(LazyNamespace, self).__init__(values)
+        self._lazy = dict(lazy)
+        both = set(self._lazy).intersection(dict.keys(self))
+        if both:
+            raise ValueError(
+                'Names both computed and lazy: {0}'.format(
+                    ', '.join(sorted(both)),
+                )
+            )
+        self.timings = {}
+
+    def __missing__(self, key):
+        func = self._lazy[key]
+        start = timeit.default_timer()
+        value = func()
+        self.timings[key] = timeit.default_timer() - start
+        del self._lazy[key]
+        self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        else:
+            return default
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._lazy
+
+    def __iter__(self):
+        return itertools.chain(dict.__iter__(self), list(self._lazy))
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._lazy)
+
+    # These compute all the lazy values
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
 
 def py_value_from_search_list(key, self, ns):
+    reads = getattr(_tracking, 'reads', None)
     value = getattr(self, key, _NOTFOUND)
     # TODO: remove `self` from search lookup
-    if value is _NOTFOUND:
+    if value is not _NOTFOUND:
+        if reads is not None:
+            reads.self_names.add(key)
+    else:
+        if reads is not None:
+            reads.namespace_names.add(key)
         value = ns.get(key, _NOTFOUND)
         if value is _NOTFOUND:
             raise NotFound('Could not find {0!r}'.format(key))
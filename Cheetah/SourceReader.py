@@ -1,34 +1,36 @@
 """SourceReader class for Cheetah's LegacyParser and CodeGenerator"""
 from __future__ import unicode_literals
 
+import array
+import bisect
 import re
 
 EOLre = re.compile(r'[ \f\t]*(?:\r\n|\r|\n)')
 EOLZre = re.compile(r'(?:\r\n|\r|\n|\Z)')
-
-
-WS_CHARS = ' \t'
+NEWLINEre = re.compile(r'\r\n|\r|\n')
+WSre = re.compile(r'[ \t]*')
 
 
 class SourceReader(object):  # pylint:disable=too-many-public-methods
     def __init__(self, src):
         self._src = src
-        self._srcLines = src.splitlines()
         self._breakPoint = len(self._src)
         self._pos = 0
 
-        # collect some meta-information
-        self._EOLs = []
-        pos = 0
-        while pos < len(self):
-            EOLmatch = EOLZre.search(src, pos)
+        # collect some meta-information: where each line begins and ends
+        self._BOLs = array.array(str('l'))
+        self._EOLs = array.array(str('l'))
+        BOL = 0
+        for EOLmatch in NEWLINEre.finditer(src):
+            self._BOLs.append(BOL)
             self._EOLs.append(EOLmatch.start())
-            pos = EOLmatch.end()
+            BOL = EOLmatch.end()
+        if BOL < len(src):
+            self._BOLs.append(BOL)
+            self._EOLs.append(len(src))
 
-        self._BOLs = []
-        for pos in self._EOLs:
-            BOLpos = self.findBOL(pos)
-            self._BOLs.append(BOLpos)
+        # The parser mostly asks about positions on the line it looked up last
+        self._lastLineNum = 0
 
     def src(self):
         return self._src
@@ -40,9 +42,13 @@ class SourceReader(object):  # pylint:disable=too-many-public-methods
         return self._src[i]
 
     def lineNum(self, pos):
-        for i in range(len(self._BOLs)):
-            if pos >= self._BOLs[i] and pos <= self._EOLs[i]:
-                return i
+        i = self._lastLineNum
+        if self._BOLs and self._BOLs[i] <= pos <= self._EOLs[i]:
+            return i
+        i = bisect.bisect_right(self._BOLs, pos) - 1
+        if i >= 0 and pos <= self._EOLs[i]:
+            self._lastLineNum = i
+            return i
         raise AssertionError('unknown position: {0}'.format(pos))
 
     def getRowCol(self, pos=None):
@@ -54,7 +60,7 @@ class SourceReader(object):  # pylint:disable=too-many-public-methods
 
     def getRowColLine(self):
         row, col = self.getRowCol()
-        return row, col, self._srcLines[row - 1]
+        return row, col, self._src.splitlines()[row - 1]
 
     def pos(self):
         return self._pos
@@ -63,9 +69,6 @@ class SourceReader(object):  # pylint:disable=too-many-public-methods
         self.checkPos(pos)
         self._pos = pos
 
-    def validPos(self, pos):
-        return pos <= self._breakPoint and pos >= 0
-
     def checkPos(self, pos):
         if not pos <= self._breakPoint:
             raise AssertionError(
@@ -95,23 +98,30 @@ class SourceReader(object):  # pylint:disable=too-many-public-methods
     def atEnd(self):
         return self._pos >= self._breakPoint
 
+    # The primitives below are called for about every character parsed, they
+    # only go through checkPos (for its error) when the position is invalid.
+
     def peek(self, offset=0):
-        self.checkPos(self._pos + offset)
         pos = self._pos + offset
+        if not 0 <= pos <= self._breakPoint:
+            self.checkPos(pos)
         return self._src[pos]
 
     def getc(self):
         pos = self._pos
-        assert self.validPos(pos + 1)
-        self._pos += 1
+        assert 0 <= pos + 1 <= self._breakPoint
+        self._pos = pos + 1
         return self._src[pos]
 
     def advance(self, offset=1):
-        self.checkPos(self._pos + offset)
-        self._pos += offset
+        pos = self._pos + offset
+        if not 0 <= pos <= self._breakPoint:
+            self.checkPos(pos)
+        self._pos = pos
 
     def readTo(self, to, start=None):
-        self.checkPos(to)
+        if not 0 <= to <= self._breakPoint:
+            self.checkPos(to)
         if start is None:
             start = self._pos
         self._pos = to
@@ -125,13 +135,10 @@ class SourceReader(object):  # pylint:disable=too-many-public-methods
             pos = EOLmatch.start()
         return self.readTo(to=pos, start=start)
 
-    def find(self, it, pos=None):
+    def startswith(self, it, pos=None):
         if pos is None:
             pos = self._pos
-        return self._src.find(it, pos)
-
-    def startswith(self, it, pos=None):
-        return self.find(it, pos) == self._pos
+        return self._src.startswith(it, pos)
 
     def findBOL(self, pos=None):
         if pos is None:
@@ -150,18 +157,10 @@ class SourceReader(object):  # pylint:disable=too-many-public-methods
         BOL = self.findBOL()
         return BOL == self._pos or self._src[BOL:self._pos].isspace()
 
-    def matchWhiteSpace(self):
-        return not self.atEnd() and self.peek() in WS_CHARS
-
     def getWhiteSpace(self, maximum=None):
-        if not self.matchWhiteSpace():
-            return ''
         start = self._pos
-        breakPoint = self.breakPoint()
+        end = self._breakPoint
         if maximum is not None:
-            breakPoint = min(breakPoint, self._pos + maximum)
-        while self._pos < breakPoint:
-            self.advance()
-            if not self.matchWhiteSpace():
-                break
+            end = min(end, start + maximum)
+        self._pos = WSre.match(self._src, start, max(start, end)).end()
         return self._src[start:self._pos]
@@ -7,8 +7,12 @@ from __future__ import unicode_literals
 import collections
 import contextlib
 
+import six
+
 from Cheetah import filters
+from Cheetah.DummyTransaction import DummyTransaction
 from Cheetah.NameMapper import NotFound
+from Cheetah.NameMapper import tracking_reads
 from Cheetah.NameMapper import value_from_search_list
 
 
@@ -21,6 +25,14 @@ NO_CONTENT = object()
 UNSPECIFIED = object()
 
 
+def _isdisjoint(namespace, names):
+    if six.PY3 and type(namespace) is dict:
+        # The keys view iterates the smaller of the two
+        return namespace.keys().isdisjoint(names)
+    else:
+        return names.isdisjoint(namespace)
+
+
 class Template(object):
     """This class provides methods used by templates at runtime
 
@@ -33,6 +45,17 @@ class Template(object):
           self._CHEETAH__searchList (_CHEETAH__xxx with 2 underscores)
     """
 
+    __slots__ = ('_CHEETAH__namespace', '_CHEETAH__currentFilter', 'transaction')
+
+    # Names compiled templates look up in the namespace (see the module
+    # attribute of the same name in compiled templates).
+    __CHEETAH_namespace_names__ = frozenset()
+
+    # Whether to check the namespace for keys colliding with the attributes
+    # of Template (which would shadow them).  It costs a little for each
+    # instantiation, set it to False once the namespaces are known to be ok.
+    __CHEETAH_check_reserved__ = True
+
     def __init__(
             self,
             namespace=None,
@@ -40,27 +63,30 @@ class Template(object):
     ):
         """Instantiates an existing template.
 
-        :param searchList: list of namespaces (objects / dicts)
+        :param namespace: Mapping of the names looked up by the template.
         :param filter_fn: Initial filter function.  A filter
             is a function which takes a single argument (the contents of a
             template variable) and may perform some output filtering.
         """
-        if namespace:
-            if (
-                    isinstance(namespace, dict) and
-                    self.Reserved_SearchList & set(namespace)
-            ):
-                raise AssertionError(
-                    'The following keys are members of the Template class '
-                    'and will result in NameMapper collisions!\n'
-                    '  > {0} \n'
-                    "Please change the key's name.".format(
-                        ', '.join(
-                            self.Reserved_SearchList &
-                            set(namespace)
-                        )
+        self._CHEETAH__reset(namespace, filter_fn)
+
+    def _CHEETAH__reset(self, namespace, filter_fn):
+        if (
+                namespace and
+                self.__CHEETAH_check_reserved__ and
+                isinstance(namespace, dict) and
+                not _isdisjoint(namespace, self.Reserved_SearchList)
+        ):
+            raise AssertionError(
+                'The following keys are members of the Template class '
+                'and will result in NameMapper collisions!\n'
+                '  > {0} \n'
+                "Please change the key's name.".format(
+                    ', '.join(
+                        sorted(self.Reserved_SearchList.intersection(namespace))
                     )
                 )
+            )
 
         if (
                 namespace is not None and
@@ -101,6 +127,17 @@ class Template(object):
     def respond(self):
         raise NotImplementedError
 
+    def respond_with_reads(self):
+        """Renders the template, recording what it read.
+
+        :return: `(output, reads)` where `reads` is a
+            `Cheetah.NameMapper.Reads` of the names resolved from `self` and
+            the names looked up in the namespace.
+        """
+        with tracking_reads() as reads:
+            output = self.respond()
+        return output, reads
+
     @contextlib.contextmanager
     def set_filter(self, filter_fn):
         before = self._CHEETAH__currentFilter
@@ -111,6 +148,29 @@ class Template(object):
             self._CHEETAH__currentFilter = before
 
 
-Template.Reserved_SearchList = set(dir(Template))
+# The instance attributes aren't reserved (as before Template had
+# __slots__).
+Template.Reserved_SearchList = frozenset(dir(Template)) - frozenset(
+    ('__slots__',) + Template.__slots__
+)
 # Alias for #extends
 YelpCheetahTemplate = Template
+
+
+def render_many(template_cls, namespaces, filter_fn=filters.markup_filter):
+    """Renders a template for each namespace, reusing a single instance (and
+    its output buffer) instead of instantiating the template again.
+
+    :param template_cls: The template class.
+    :param namespaces: Iterable of namespaces (see `Template.__init__`).
+    :param filter_fn: Initial filter function.
+    :return: Generator of the outputs.
+    """
+    template = template_cls()
+    transaction = DummyTransaction()
+    for namespace in namespaces:
+        template._CHEETAH__reset(namespace, filter_fn)
+        template.transaction = transaction
+        template.respond()
+        yield transaction.getvalue()
+        transaction.clear()
@@ -6,13 +6,85 @@ import ast
 import six
 
 
+# Templates repeat the same directives a lot, parsed statements are memoized.
+# Like the `re` module's cache, the memo is simply emptied when it is full.
+_MAXCACHE = 1000
+_parse_cache = {}
+
+
+def _cache(statement, body):
+    if len(_parse_cache) >= _MAXCACHE:
+        _parse_cache.clear()
+    _parse_cache[statement] = body
+
+
+def _parse(statement):
+    """Returns the (memoized) body of the module made of `statement`."""
+    try:
+        return _parse_cache[statement]
+    except KeyError:
+        body = tuple(ast.parse(statement).body)
+        _cache(statement, body)
+        return body
+
+
+def parse_batch(statements):
+    """Parses many statements with one call to `ast.parse`, memoizing them
+    for get_imported_names and get_lvalues.
+
+    Statements which can't be parsed on their own are skipped, so
+    get_imported_names / get_lvalues still raise for them.
+    """
+    statements = [
+        statement for statement in set(statements)
+        if statement not in _parse_cache and '\r' not in statement
+    ]
+    if not statements:
+        return
+
+    starts = []
+    lineno = 1
+    for statement in statements:
+        starts.append(lineno)
+        lineno += statement.count('\n') + 1
+
+    try:
+        body = ast.parse('\n'.join(statements)).body
+    except SyntaxError:
+        body = None
+    if body is not None:
+        # Map the statements of the module back to the source statements.
+        # Each of them must start a statement at its first line, otherwise
+        # some of them only parse when joined with the others.
+        bodies = [[] for _ in statements]
+        i = 0
+        for node in body:
+            while i + 1 < len(starts) and node.lineno >= starts[i + 1]:
+                i += 1
+            bodies[i].append(node)
+        if all(
+                stmt_body and
+                (stmt_body[0].lineno, stmt_body[0].col_offset) == (start, 0)
+                for stmt_body, start in zip(bodies, starts)
+        ):
+            for statement, stmt_body in zip(statements, bodies):
+                _cache(statement, tuple(stmt_body))
+            return
+
+    for statement in statements:
+        try:
+            _parse(statement)
+        except SyntaxError:
+            pass
+
+
 def _to_top_level_name(name):
     # We only really care about the first segment for name resolution
     return (name.asname or name.name).partition('.')[0]
 
 
 def get_imported_names(import_statement):
-    ast_import = ast.parse(import_statement).body[0]
+    ast_import = _parse(import_statement)[0]
     return [
         _to_top_level_name(name)
         for name in ast_import.names
@@ -20,6 +92,65 @@ def get_imported_names(import_statement):
     ]
 
 
+def get_from_import(import_statement):
+    """Returns `(module, [(name, local_name), ...])` for an absolute
+    `from module import ...` statement or None for other imports.
+    """
+    ast_import = _parse(import_statement)[0]
+    if not isinstance(ast_import, ast.ImportFrom) or ast_import.level:
+        return None
+    return ast_import.module, [
+        (name.name, name.asname or name.name)
+        for name in ast_import.names
+        if name.name != '*'
+    ]
+
+
+def get_call_arguments(call_args):
+    """Returns `(positional, keywords)` for the arguments of a call (the text
+    between its parentheses): the number of positional arguments (None with
+    `*args`, the number is unknown then) and the names of the keyword
+    arguments (None for `**kwargs`).
+    """
+    return _call_arguments(_parse('_(' + call_args + ')')[0].value)
+
+
+def _call_arguments(call):
+    if (
+            getattr(call, 'starargs', None) or
+            any(type(arg).__name__ == 'Starred' for arg in call.args)
+    ):
+        positional = None
+    else:
+        positional = len(call.args)
+    keywords = [keyword.arg for keyword in call.keywords]
+    if getattr(call, 'kwargs', None):  # pragma: no cover (PY2)
+        keywords.append(None)
+    return positional, keywords
+
+
+def passes_self(call):
+    """Returns whether `call`, the text following the name of a called
+    function (`(self, x)[0]`), may pass it `self`: as the first positional
+    argument, as a keyword argument or through `*args` / `**kwargs`.
+    """
+    call = _parse('_' + call)[0].value
+    # Down the chain of calls, subscripts and attributes to the call of `_`
+    while not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name)):
+        call = call.func if isinstance(call, ast.Call) else call.value
+    positional, keywords = _call_arguments(call)
+    return (
+        positional is None or
+        'self' in keywords or
+        None in keywords or
+        bool(
+            call.args and
+            isinstance(call.args[0], ast.Name) and
+            call.args[0].id == 'self'
+        )
+    )
+
+
 class TargetsVisitor(ast.NodeVisitor):
     def __init__(self):
         self.lvalues = []
@@ -66,7 +197,7 @@ class TopLevelVisitor(ast.NodeVisitor):
 
 
 def get_lvalues(expression):
-    ast_obj = ast.parse(expression)
     visitor = TopLevelVisitor()
-    visitor.visit(ast_obj)
+    for node in _parse(expression):
+        visitor.visit(node)
     return visitor.targets_visitor.lvalues
@@ -0,0 +1,120 @@
+"""Rendering of many compiled templates in a pool of processes.
+
+    report = BatchReport()
+    jobs = (('templates.email', {'user': user}) for user in users)
+    for result in render_batch(jobs, report=report):
+        send(result.output)
+
+Rendering is CPU bound python: processes (unlike threads) render in
+parallel.  Each worker imports a template module (and instantiates its
+template, like `Cheetah.Template.render_many`) once.  The namespaces and
+the outputs are pickled to be sent between the processes, jobs are sent by
+chunks of `chunksize`.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import collections
+import multiprocessing
+import timeit
+
+from Cheetah.filters import markup_filter
+from Cheetah.legacy_compiler import CLASS_NAME
+
+
+RenderResult = collections.namedtuple(
+    'RenderResult', ['index', 'module_name', 'output', 'seconds'],
+)
+
+
+class BatchReport(object):
+    """Number of renders and seconds spent rendering (in the workers) by
+    template module.
+    """
+
+    def __init__(self):
+        self.renders = collections.defaultdict(int)
+        self.seconds = collections.defaultdict(float)
+
+    def add(self, result):
+        self.renders[result.module_name] += 1
+        self.seconds[result.module_name] += result.seconds
+
+    def throughput(self):
+        """Renders per second by template module."""
+        return dict(
+            (
+                module_name,
+                renders / self.seconds[module_name]
+                if self.seconds[module_name] else
+                float('inf'),
+            )
+            for module_name, renders in self.renders.items()
+        )
+
+
+# Template instances of the worker, by module name
+_instances = {}
+
+
+def _instance(module_name):
+    try:
+        return _instances[module_name]
+    except KeyError:
+        module = __import__(module_name, fromlist=[str('__trash')], level=0)
+        instance = _instances[module_name] = getattr(module, CLASS_NAME)()
+        return instance
+
+
+def _render(job):
+    index, module_name, namespace = job
+    instance = _instance(module_name)
+    start = timeit.default_timer()
+    instance._CHEETAH__reset(namespace, markup_filter)
+    try:
+        output = instance.respond()
+    finally:
+        # Don't keep the namespace alive until the next job
+        instance._CHEETAH__reset(None, markup_filter)
+    return RenderResult(
+        index, module_name, output, timeit.default_timer() - start,
+    )
+
+
+def render_batch(
+        jobs, processes=None, chunksize=100, ordered=True, report=None,
+):
+    """Renders templates in a pool of processes.
+
+    :param jobs: Iterable of `(module_name, namespace)` where `module_name`
+        is the name of a compiled template module.
+    :param processes: Number of processes (defaults to the number of cpus),
+        with 1 the templates are rendered in this process.
+    :param int chunksize: Number of jobs sent to a worker at once.
+    :param bool ordered: Whether the results are in the order of the jobs
+        or in the order they are rendered.
+    :param BatchReport report: Report updated with each result.
+    :return: Generator of `RenderResult`s, `index` being the index of the
+        job.
+    """
+    jobs = (
+        (index, module_name, namespace)
+        for index, (module_name, namespace) in enumerate(jobs)
+    )
+    if processes == 1:
+        results = (_render(job) for job in jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        imap = pool.imap if ordered else pool.imap_unordered
+        results = imap(_render, jobs, chunksize)
+
+    try:
+        for result in results:
+            if report is not None:
+                report.add(result)
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,156 @@
+"""Bundles compiled templates into a single file.
+
+A large tree of compiled templates is thousands of small modules (plus their
+`__init__.py` stubs) and every import of one of them stats the filesystem
+several times.  A bundle holds the code objects of all of them in one file;
+`install_bundle` serves them from memory under their usual dotted names so
+`#extends` and `#from ... import` keep working unchanged.
+
+Bundles contain marshalled code objects and are therefore only loadable by
+the python version which wrote them.  The packages of a bundle keep their
+directories (found on `sys.path`) as `__path__`, so the python modules
+living next to the templates stay importable.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import imp
+import io
+import marshal
+import os.path
+import sys
+
+try:
+    from importlib.machinery import ModuleSpec
+except ImportError:  # pragma: no cover (PY2)
+    ModuleSpec = None
+
+
+BUNDLE_HEADER = b'yelp_cheetah bundle\n' + imp.get_magic()
+
+
+def write_bundle(filename, modules):
+    """Writes a bundle.
+
+    :param text filename: Filename of the bundle to write.
+    :param dict modules: Maps dotted module names to `(is_package, source)`
+        where `source` is the text of the module's python source.
+    """
+    code_objects = {}
+    for module_name, (is_package, source) in modules.items():
+        code_filename = _module_filename(filename, module_name, is_package)
+        code = compile(source, code_filename, 'exec', dont_inherit=True)
+        code_objects[module_name] = (is_package, code)
+
+    with io.open(filename, 'wb') as bundle_file:
+        bundle_file.write(BUNDLE_HEADER)
+        bundle_file.write(marshal.dumps(code_objects))
+
+
+def _module_filename(filename, module_name, is_package):
+    parts = module_name.split('.')
+    if is_package:
+        parts.append('__init__')
+    return os.path.join(filename, *parts) + '.py'
+
+
+class BundleImporter(object):
+    """Importer serving the modules contained in a bundle: a PEP 451 finder
+    and loader for python 3 (find_spec / exec_module), a PEP 302 importer
+    for python 2 (find_module / load_module).
+    """
+
+    def __init__(self, filename):
+        with io.open(filename, 'rb') as bundle_file:
+            contents = bundle_file.read()
+        if not contents.startswith(BUNDLE_HEADER):
+            raise ImportError(
+                '{0} is not a bundle written by this version of python'.format(
+                    filename,
+                )
+            )
+        self.filename = filename
+        self._modules = marshal.loads(contents[len(BUNDLE_HEADER):])
+
+    def module_names(self):
+        return sorted(self._modules)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname not in self._modules:
+            return None
+        is_package, code = self._modules[fullname]
+        spec = ModuleSpec(
+            fullname, self, origin=code.co_filename, is_package=is_package,
+        )
+        # Sets __file__
+        spec.has_location = True
+        if is_package:
+            spec.submodule_search_locations = _package_path(fullname)
+        return spec
+
+    def create_module(self, spec):
+        return None  # The default module
+
+    def exec_module(self, module):
+        _, code = self._modules[module.__name__]
+        exec(code, module.__dict__)  # pylint:disable=exec-used
+
+    def find_module(self, fullname, path=None):
+        if fullname in self._modules:
+            return self
+        else:
+            return None
+
+    def load_module(self, fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+
+        is_package, code = self._modules[fullname]
+        # The import machinery of python 2 requires native strings
+        fullname = str(fullname)
+        module = imp.new_module(fullname)
+        module.__file__ = code.co_filename
+        module.__loader__ = self
+        if is_package:
+            module.__path__ = _package_path(fullname)
+            module.__package__ = fullname
+        else:
+            module.__package__ = fullname.rpartition(str('.'))[0]
+
+        sys.modules[fullname] = module
+        try:
+            exec(code, module.__dict__)  # pylint:disable=exec-used
+        except BaseException:
+            del sys.modules[fullname]
+            raise
+        return sys.modules[fullname]
+
+
+def _package_path(fullname):
+    """The `__path__` of a package: its directory found like the normal
+    import system would (if it exists).
+    """
+    parent, _, name = fullname.rpartition(str('.'))
+    if parent:
+        parent_path = sys.modules[parent].__path__
+    else:
+        parent_path = sys.path
+    for directory in parent_path:
+        package_directory = os.path.join(directory, name)
+        if os.path.isdir(package_directory):
+            return [package_directory]
+    return []
+
+
+def install_bundle(filename):
+    """Makes the modules in the bundle importable.
+
+    The bundle takes precedence over the filesystem for the modules it
+    contains.
+
+    :param text filename: Filename of the bundle.
+    :return: The installed `BundleImporter`.
+    """
+    importer = BundleImporter(filename)
+    sys.meta_path.insert(0, importer)
+    return importer
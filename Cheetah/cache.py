@@ -0,0 +1,250 @@
+"""Caching of rendered template fragments (the `#cache` directive).
+
+    #cache ('business_card', $business.id), ttl=300
+        ...
+    #end cache
+
+The output of the region is stored in `fragment_cache` under the evaluated
+key (scoped by the template's module and the line and column of the region)
+and written without running the
+region again until it expires.  Keys must be hashable and have a `repr`
+which identifies them (for `MemcachedCache`).
+
+The default backend is an in-process `LRUCache`, others are plugged in with
+`fragment_cache.backend = MemcachedCache(('127.0.0.1', 11211))`.  Backends
+implement `get(key)` returning the cached text or None and
+`set(key, value, ttl)` where `ttl` is in seconds or None for no expiry.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import hashlib
+import math
+import socket
+import threading
+import time
+
+
+# Fields of the links of the LRUCache's list
+PREV, NEXT, KEY, VALUE, EXPIRES = 0, 1, 2, 3, 4
+
+# memcached reads expiration times over 30 days as unix timestamps
+MAX_RELATIVE_EXPTIME = 30 * 24 * 60 * 60
+
+
+class LRUCache(object):
+    """In-process cache keeping the `maxsize` most recently used values.
+
+    :param int maxsize: Maximum number of values kept.
+    :param timer: Function returning the current time in seconds.
+    """
+
+    def __init__(self, maxsize=1024, timer=time.time):
+        self.maxsize = maxsize
+        self._timer = timer
+        self._lock = threading.Lock()
+        # Circular doubly linked list of [prev, next, key, value, expires]
+        # from the least to the most recently used
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None, None]
+        self._links = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._links)
+
+    def _unlink(self, link):
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+
+    def _append(self, link):
+        last = self._root[PREV]
+        link[PREV], link[NEXT] = last, self._root
+        last[NEXT] = self._root[PREV] = link
+
+    def get(self, key):
+        with self._lock:
+            link = self._links.get(key)
+            if (
+                    link is not None and
+                    link[EXPIRES] is not None and
+                    link[EXPIRES] <= self._timer()
+            ):
+                self._unlink(link)
+                del self._links[key]
+                link = None
+
+            if link is None:
+                self.misses += 1
+                return None
+            else:
+                self.hits += 1
+                self._unlink(link)
+                self._append(link)
+                return link[VALUE]
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else self._timer() + ttl
+        with self._lock:
+            link = self._links.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+            elif len(self._links) >= self.maxsize:
+                oldest = self._root[NEXT]
+                self._unlink(oldest)
+                del self._links[oldest[KEY]]
+                self.evictions += 1
+
+            link = [None, None, key, value, expires]
+            self._append(link)
+            self._links[key] = link
+
+    def clear(self):
+        with self._lock:
+            self._root[:] = [self._root, self._root, None, None, None]
+            self._links.clear()
+
+
+class MemcachedError(Exception):
+    pass
+
+
+class MemcachedCache(object):
+    """Client of a server speaking the memcached text protocol.
+
+    Keys are hashed to fit memcached's restrictions.  The cache is an
+    optimization, when the server can't be reached (or misbehaves) values
+    are missing and `errors` is incremented.
+
+    :param tuple address: `(host, port)` of the server.
+    :param float timeout: Socket timeout in seconds.
+    :param text prefix: Prefix of the keys, to share a server.
+    :param timer: Function returning the current time in seconds.
+    """
+
+    def __init__(
+            self, address=('127.0.0.1', 11211), timeout=1.0, prefix='cheetah:',
+            timer=time.time,
+    ):
+        self.address = address
+        self.timeout = timeout
+        self.prefix = prefix
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._socket = self._file = None
+        self.hits = self.misses = self.errors = 0
+
+    def _exptime(self, ttl):
+        """The memcached expiration time of a value kept `ttl` seconds."""
+        if ttl is None:
+            return 0  # Never expires
+        # Expiration times are whole seconds, 0 meaning never
+        exptime = int(math.ceil(ttl))
+        if exptime > MAX_RELATIVE_EXPTIME:
+            exptime = int(math.ceil(self._timer() + ttl))
+        return exptime
+
+    def _key(self, key):
+        digest = hashlib.sha1(repr(key).encode('UTF-8')).hexdigest()
+        return (self.prefix + digest).encode('UTF-8')
+
+    def _connect(self):
+        if self._socket is None:
+            self._socket = socket.create_connection(
+                self.address, self.timeout,
+            )
+            self._file = self._socket.makefile('rb')
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def _readline(self):
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise MemcachedError('Connection closed')
+        return line
+
+    def _request(self, request, read_response):
+        with self._lock:
+            try:
+                self._connect()
+                self._socket.sendall(request)
+                return read_response()
+            except (socket.error, MemcachedError):
+                self._close()
+                self.errors += 1
+                return None
+
+    def get(self, key):
+        def read_response():
+            line = self._readline()
+            value = None
+            if line.startswith(b'VALUE '):
+                length = int(line.split()[3])
+                value = self._file.read(length + 2)[:-2].decode('UTF-8')
+                line = self._readline()
+            if line != b'END\r\n':
+                raise MemcachedError(line)
+            return value
+
+        value = self._request(b'get ' + self._key(key) + b'\r\n', read_response)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        def read_response():
+            line = self._readline()
+            if line != b'STORED\r\n':
+                raise MemcachedError(line)
+
+        if ttl is not None and ttl <= 0:
+            return  # Expired already, like in the LRUCache
+
+        data = value.encode('UTF-8')
+        request = b''.join((
+            b'set ', self._key(key),
+            ' 0 {0} {1}\r\n'.format(
+                self._exptime(ttl), len(data),
+            ).encode('UTF-8'),
+            data, b'\r\n',
+        ))
+        self._request(request, read_response)
+
+
+class CachedFragment(object):
+    """A lookup in the fragment cache, `value` is None when it missed."""
+
+    def __init__(self, backend, key, ttl, value):
+        self._backend = backend
+        self._key = key
+        self._ttl = ttl
+        self.value = value
+
+    def store(self, value):
+        self._backend.set(self._key, value, self._ttl)
+        self.value = value
+
+
+class FragmentCache(object):
+    """Used by the code generated for `#cache`."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def lookup(self, namespace, region, key, ttl=None):
+        backend = self.backend
+        key = (namespace, region, key)
+        return CachedFragment(backend, key, ttl, backend.get(key))
+
+
+fragment_cache = FragmentCache(LRUCache())
@@ -4,20 +4,40 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import argparse
+import io
+import json
+import multiprocessing
 import os
 import os.path
 import sys
 
 import six
 
+from Cheetah.bundle import write_bundle
 from Cheetah.compile import compile_file
+from Cheetah.compile import compile_source
+from Cheetah.legacy_parser import ParseError
 
 
-def compile_template(filename, **kwargs):
+def compile_template(filename, report=None, progress_file=None, **kwargs):
+    """Compiles a single template.
+
+    :param text filename: Filename of the template.
+    :param list report: If given, a dict of compile statistics for the
+        template (see `compile_source`) is appended to it.
+    :param progress_file: Where to print the progress, defaults to stdout.
+    :param kwargs: additional arguments to pass to compiler.
+    """
     if not isinstance(filename, six.text_type):
         filename = filename.decode('UTF-8')
-    print('Compiling {0}'.format(filename))
-    return compile_file(filename, **kwargs)
+    print('Compiling {0}'.format(filename), file=progress_file)
+    if report is None:
+        return compile_file(filename, **kwargs)
+
+    stats = {'filename': filename}
+    target = compile_file(filename, stats=stats, **kwargs)
+    report.append(stats)
+    return target
 
 
 def _compile_files_in_directory(
@@ -35,20 +55,23 @@ def _compile_files_in_directory(
     return any(filename.endswith(extension) for filename in filenames)
 
 
-def _touch_init_if_not_exists(directory):
+def _touch_init_if_not_exists(directory, progress_file=None):
     if '__pycache__' in directory:
         return
     init_py_file = os.path.join(directory, '__init__.py')
     if not os.path.exists(init_py_file):
-        print('Creating {0}'.format(init_py_file))
+        print('Creating {0}'.format(init_py_file), file=progress_file)
         open(init_py_file, 'a').close()
 
 
-def compile_directories(directories, extension='.tmpl', **kwargs):
+def compile_directories(
+        directories, extension='.tmpl', progress_file=None, **kwargs
+):
     """Compiles all templates in the given directories.  Touches __init__.py
     for each sub-package inside the directories to make the outputs importable.
 
     :param tuple directories: Iterable of directories to iterate.
+    :param progress_file: Where to print the progress, defaults to stdout.
     :param kwargs: additional arguments to pass to compiler.
     """
     for directory in directories:
@@ -58,10 +81,181 @@ def compile_directories(directories, extension='.tmpl', **kwargs):
                 dirpath,
                 filenames,
                 extension=extension,
+                progress_file=progress_file,
                 **kwargs
             )
 
-            _touch_init_if_not_exists(dirpath)
+            _touch_init_if_not_exists(dirpath, progress_file=progress_file)
+
+
+def _module_name(filename):
+    dirname, basename = os.path.split(os.path.relpath(filename))
+    parts = dirname.split(os.sep) if dirname else []
+    parts.append(basename.split('.', 1)[0])
+    return '.'.join(parts)
+
+
+def _bundle_template(modules, filename, report, progress_file):
+    print('Compiling {0}'.format(filename), file=progress_file)
+    contents = io.open(filename, encoding='UTF-8').read()
+    if report is None:
+        stats = None
+    else:
+        stats = {'filename': filename}
+        report.append(stats)
+    modules[_module_name(filename)] = (
+        False, compile_source(contents, stats=stats),
+    )
+
+
+def _bundle_package(modules, directory):
+    if '__pycache__' in directory:
+        return
+    init_py_file = os.path.join(directory, '__init__.py')
+    if os.path.exists(init_py_file):
+        source = io.open(init_py_file, encoding='UTF-8').read()
+    else:
+        source = ''
+    modules[_module_name(init_py_file).rpartition('.')[0]] = (True, source)
+
+
+def _bundle_parent_packages(modules, filename):
+    dirname = os.path.dirname(os.path.relpath(filename))
+    while dirname:
+        _bundle_package(modules, dirname)
+        dirname = os.path.dirname(dirname)
+
+
+def compile_bundle(
+        filenames, bundle_filename, extension='.tmpl', report=None,
+        progress_file=None,
+):
+    """Compiles templates into a single bundle instead of `.py` files.
+
+    Module names are the paths of the templates relative to the current
+    directory.  Each directory searched for templates and each parent
+    directory of the templates becomes a package in the bundle.
+
+    :param tuple filenames: Iterable of templates / directories to compile.
+    :param text bundle_filename: Filename of the bundle to write.
+    :param list report: If given, compile statistics of each template are
+        appended to it.
+    :param progress_file: Where to print the progress, defaults to stdout.
+    """
+    modules = {}
+    for filename in filenames:
+        if not isinstance(filename, six.text_type):
+            filename = filename.decode('UTF-8')
+        if os.path.isdir(filename):
+            for dirpath, _, dir_filenames in os.walk(filename):
+                for dir_filename in dir_filenames:
+                    if dir_filename.endswith(extension):
+                        _bundle_template(
+                            modules,
+                            os.path.join(dirpath, dir_filename),
+                            report,
+                            progress_file,
+                        )
+                _bundle_package(modules, dirpath)
+        else:
+            _bundle_template(modules, filename, report, progress_file)
+            _bundle_parent_packages(modules, filename)
+
+    print('Writing {0}'.format(bundle_filename), file=progress_file)
+    write_bundle(bundle_filename, modules)
+
+
+def compile_worker(requests, responses):
+    """Compiles templates on request, for build systems which would
+    otherwise start a new `cheetah-compile` process for every template.
+
+    Each request is a line of json: `{"source": ..., "target": ...,
+    "settings": ..., "id": ...}` where all but `source` are optional.  Each
+    response is a line of json: `{"id": ..., "target": ...}` on success or
+    `{"id": ..., "error": ..., "error_type": ...}` when the template failed
+    to compile (for instance a `ParseError`) or the request is malformed
+    (the `id` is then null).  The worker keeps going after failures and stops
+    at the end of the requests.
+
+    :param requests: File-like object to read requests from (stdin).
+    :param responses: Text file-like object to write responses to (stdout).
+    """
+    for line in requests:
+        if not line.strip():
+            continue
+        response = {'id': None}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('Expected a json object: {0}'.format(line.strip()))
+            response['id'] = request.get('id')
+            response['target'] = compile_file(
+                request['source'],
+                target=request.get('target'),
+                settings=request.get('settings'),
+            )
+        except Exception as e:
+            response['error'] = six.text_type(e)
+            response['error_type'] = type(e).__name__
+        responses.write(six.text_type(json.dumps(response, sort_keys=True)))
+        responses.write('\n')
+        responses.flush()
+
+
+def check_template(filename):
+    """Compiles a single template without writing anything.
+
+    :param text filename: Filename of the template.
+    :return: `None` if the template compiles or an error message of the form
+        `filename:row:col: message` (`filename: message` when the template
+        can't be read).
+    """
+    if not isinstance(filename, six.text_type):
+        filename = filename.decode('UTF-8')
+    try:
+        contents = io.open(filename, encoding='UTF-8').read()
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        return '{0}: {1}: {2}'.format(filename, type(e).__name__, e)
+    try:
+        compile_source(contents)
+    except ParseError as e:
+        row, col = e.stream.getRowCol()
+        return '{0}:{1}:{2}: {3}'.format(filename, row, col, e.msg.strip())
+    else:
+        return None
+
+
+def _template_filenames(filenames, extension):
+    for filename in filenames:
+        if os.path.isdir(filename):
+            for dirpath, _, dir_filenames in os.walk(filename):
+                for dir_filename in sorted(dir_filenames):
+                    if dir_filename.endswith(extension):
+                        yield os.path.join(dirpath, dir_filename)
+        else:
+            yield filename
+
+
+def check_templates(filenames, extension='.tmpl', processes=None):
+    """Compiles templates (in parallel) to find their errors quickly, without
+    writing anything.
+
+    :param tuple filenames: Iterable of templates / directories to check.
+    :param int processes: Number of worker processes, defaults to the number
+        of cpus.  With `1` the templates are checked in this process.
+    :return: List of the error messages, in the order of `filenames`.
+    """
+    filenames = list(_template_filenames(filenames, extension))
+    if processes == 1:
+        results = [check_template(filename) for filename in filenames]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(check_template, filenames)
+        finally:
+            pool.close()
+            pool.join()
+    return [error for error in results if error is not None]
 
 
 def compile_all(argv):
@@ -74,21 +268,106 @@ def compile_all(argv):
         '--extension', default='.tmpl',
         help='File extension to use for compiling directories',
     )
+    parser.add_argument(
+        '--bundle',
+        help=(
+            'Write all compiled templates to this single bundle file instead '
+            'of writing `.py` files.  See `Cheetah.bundle`.'
+        ),
+    )
+    parser.add_argument(
+        '--report', choices=('json',),
+        help=(
+            'Report the time spent parsing, generating code and writing as '
+            'well as sizes and counts for each template.'
+        ),
+    )
+    parser.add_argument(
+        '--report-file', default='-',
+        help=(
+            'Where to write the report, defaults to stdout (the progress is '
+            'then written to stderr).'
+        ),
+    )
+    parser.add_argument(
+        '--worker', action='store_true',
+        help=(
+            'Run as a persistent worker: read compile requests as lines of '
+            'json from stdin and answer on stdout.  See `compile_worker`.'
+        ),
+    )
+    parser.add_argument(
+        '--check', action='store_true',
+        help=(
+            'Only compile the templates and report all their errors, without '
+            'writing anything.  Exits nonzero if there are errors.'
+        ),
+    )
+    parser.add_argument(
+        '--jobs', type=int,
+        help='Number of processes for `--check`, defaults to the cpu count.',
+    )
     args = parser.parse_args(argv)
 
-    directories = [
-        filename for filename in args.filenames if os.path.isdir(filename)
-    ]
-    files = [
-        filename for filename in args.filenames if not os.path.isdir(filename)
-    ]
-    compile_directories(directories, extension=args.extension)
-    for filename in files:
-        compile_template(filename)
+    if args.worker:
+        compile_worker(sys.stdin, sys.stdout)
+        return
+
+    if args.check:
+        errors = check_templates(
+            args.filenames, extension=args.extension, processes=args.jobs,
+        )
+        for error in errors:
+            print(error)
+        return 1 if errors else 0
+
+    report = [] if args.report else None
+
+    if report is not None and args.report_file == '-':
+        # Keep stdout valid json
+        progress_file = sys.stderr
+    else:
+        progress_file = None
+
+    if args.bundle:
+        compile_bundle(
+            args.filenames, args.bundle,
+            extension=args.extension, report=report,
+            progress_file=progress_file,
+        )
+    else:
+        directories = [
+            filename for filename in args.filenames if os.path.isdir(filename)
+        ]
+        files = [
+            filename
+            for filename in args.filenames
+            if not os.path.isdir(filename)
+        ]
+        compile_directories(
+            directories, extension=args.extension, report=report,
+            progress_file=progress_file,
+        )
+        for filename in files:
+            compile_template(
+                filename, report=report, progress_file=progress_file,
+            )
+
+    if report is not None:
+        _write_report(report, args.report_file)
+
+
+def _write_report(report, report_filename):
+    report_json = json.dumps(report, indent=4, sort_keys=True)
+    if report_filename == '-':
+        print(report_json)
+    else:
+        with io.open(report_filename, 'w', encoding='UTF-8') as report_file:
+            report_file.write(six.text_type(report_json + '\n'))
 
 
 def main():  # pragma: no cover (called by commandline only)
-    compile_all(sys.argv[1:])
+    return compile_all(sys.argv[1:])
 
 
 if __name__ == '__main__':
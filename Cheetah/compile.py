@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 import imp
 import io
 import os.path
+import timeit
 
 import six
 
@@ -14,12 +15,18 @@ def compile_source(
         source,
         settings=None,
         compiler_cls=LegacyCompiler,
+        stats=None,
 ):
     """The general case for compiling from source.
 
     :param text source: Text representing the cheetah source.
     :param dict settings: Compile settings
     :param type compiler_cls: Class to use for the compiler.
+    :param dict stats: If given, it is updated with the time spent parsing
+        and generating code, the sizes of the source and the output,
+        counts of placeholders, directives and NameMapper lookups and the
+        names looked up in the namespace (see
+        `LegacyCompiler.get_namespace_names`).
     :return: The compiled output.
     :rtype: text
     :raises TypeError: if source is not text.
@@ -30,13 +37,30 @@ def compile_source(
         )
 
     compiler = compiler_cls(source, settings=settings)
-    return compiler.getModuleCode()
-
-
-def compile_file(filename, target=None, **kwargs):
+    if stats is None:
+        return compiler.getModuleCode()
+
+    start = timeit.default_timer()
+    compiler.parse()
+    parsed = timeit.default_timer()
+    compiled_source = compiler.getModuleCode()
+    stats.update(compiler.get_namespace_names())
+    stats.update(
+        compiler.get_counts(),
+        parse_seconds=parsed - start,
+        codegen_seconds=timeit.default_timer() - parsed,
+        source_bytes=len(source.encode('UTF-8')),
+        generated_bytes=len(compiled_source.encode('UTF-8')),
+    )
+    return compiled_source
+
+
+def compile_file(filename, target=None, stats=None, **kwargs):
     """Compiles a file.
 
     :param text filename: Filename of the file to open
+    :param dict stats: If given, it is updated with the statistics collected
+        by `compile_source` and the time spent writing the output.
     :param kwargs: Keyword args passed to `compile`
     """
     if not isinstance(filename, six.text_type):
@@ -47,15 +71,18 @@ def compile_file(filename, target=None, **kwargs):
     contents = io.open(filename, encoding='UTF-8').read()
 
     py_file = os.path.basename(filename).split('.', 1)[0] + '.py'
-    compiled_source = compile_source(contents, **kwargs)
+    compiled_source = compile_source(contents, stats=stats, **kwargs)
 
     if target is None:
         dirname = os.path.dirname(filename)
         target = os.path.join(dirname, py_file)
 
+    start = timeit.default_timer()
     with io.open(target, 'w', encoding='UTF-8') as target_file:
         target_file.write('# -*- coding: UTF-8 -*-\n')
         target_file.write(compiled_source)
+    if stats is not None:
+        stats['write_seconds'] = timeit.default_timer() - start
 
     return target
 
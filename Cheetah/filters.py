@@ -1,11 +1,15 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import sys
+
 import markupsafe
 import six
 
+import _cheetah
+
 
-def unicode_filter(val):
+def py_unicode_filter(val):
     if val is None:
         return ''
     elif isinstance(val, six.text_type):
@@ -16,6 +20,14 @@ def unicode_filter(val):
         return six.text_type(val)
 
 
-def markup_filter(val):
-    val = unicode_filter(val)
+def py_markup_filter(val):
+    val = py_unicode_filter(val)
     return markupsafe.Markup.escape(val)
+
+
+if '__pypy__' in sys.builtin_module_names:  # pragma: no cover
+    unicode_filter = py_unicode_filter
+    markup_filter = py_markup_filter
+else:   # pragma: no cover
+    unicode_filter = _cheetah.unicode_filter
+    markup_filter = _cheetah.markup_filter
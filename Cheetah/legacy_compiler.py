@@ -12,22 +12,38 @@ from __future__ import unicode_literals
 import collections
 import contextlib
 import copy
+import functools
+import hashlib
 import re
+import sys
 import textwrap
 import warnings
 
 import six
 
+from Cheetah.ast_utils import get_call_arguments
+from Cheetah.ast_utils import get_from_import
 from Cheetah.ast_utils import get_imported_names
 from Cheetah.ast_utils import get_lvalues
+from Cheetah.ast_utils import passes_self
+from Cheetah.ast_utils import parse_batch
+from Cheetah.legacy_parser import Comment
+from Cheetah.legacy_parser import Directive
+from Cheetah.legacy_parser import End
 from Cheetah.legacy_parser import escapedNewlineRE
+from Cheetah.legacy_parser import iter_nodes
 from Cheetah.legacy_parser import LegacyParser
+from Cheetah.legacy_parser import ParseError
+from Cheetah.legacy_parser import Placeholder
+from Cheetah.legacy_parser import Strip
+from Cheetah.legacy_parser import Text
 from Cheetah.SettingsManager import SettingsManager
 
 
 CallDetails = collections.namedtuple(
     'CallDetails', ['call_id', 'function_name', 'args', 'lineCol'],
 )
+CacheDetails = collections.namedtuple('CacheDetails', ['cache_id', 'lineCol'])
 
 INDENT = 4 * ' '
 
@@ -40,13 +56,35 @@ _DEFAULT_COMPILER_SETTINGS = [
     ('useNameMapper', True, 'Enable NameMapper for dotted notation and searchList support'),
     ('useLegacyImportMode', True, 'All #import statements are relocated to the top of the generated Python module'),
     ('gettextTokens', ['_', 'gettext', 'ngettext', 'pgettext', 'npgettext'], ''),
+    (
+        'directPartialCalls', False,
+        'Call functions imported from partial templates with an explicit self '
+        'instead of through their default_self wrapper (the imported modules '
+        'are imported while compiling to find them: the compiled code depends '
+        'on which modules are importable, enable it only when the partial '
+        'templates are compiled first)',
+    ),
+    (
+        'useSlots', False,
+        'Give the template class empty __slots__: its instances have no '
+        '__dict__ (when its base classes have none either)',
+    ),
 ]
 
 DEFAULT_COMPILER_SETTINGS = dict((v[0], v[1]) for v in _DEFAULT_COMPILER_SETTINGS)
 
+CACHE_IMPORT = 'from Cheetah.cache import fragment_cache as FRAGMENT_CACHE'
+
 CLASS_NAME = 'YelpCheetahTemplate'
 BASE_CLASS_NAME = 'YelpCheetahBaseClass'
 
+# The template's tree doesn't depend on the compiler settings, so compiling
+# a source again (for instance with other settings) only compiles its tree.
+# Parses are memoized by parser class and hash of the source; like the `re`
+# module's cache, the memo is simply emptied when it is full.
+_MAXCACHE = 100
+_parse_cache = {}
+
 
 def genPlainVar(nameChunks):
     """Generate Python code for a Cheetah $var without using NameMapper."""
@@ -61,6 +99,45 @@ def genNameMapperVar(nameChunks):
     return start + ('.' if tail else '') + tail
 
 
+def genPartialCall(nameChunks):
+    """Generate Python code calling a partial template function with an
+    explicit self, bypassing its default_self wrapper.
+    """
+    name, rest = nameChunks[0]
+    args = rest[1:]
+    if args.lstrip().startswith(')'):
+        args = '(self' + args
+    else:
+        args = '(self, ' + args
+    return genPlainVar([(name + '.__wrapped__', args)] + nameChunks[1:])
+
+
+def _partial_functions(import_statement):
+    """Returns the names bound to partial template functions by
+    `import_statement`.  Modules which can't be imported while compiling are
+    assumed not to be partial templates.
+    """
+    from_import = get_from_import(import_statement)
+    if from_import is None:
+        return ()
+    module_name, names = from_import
+    try:
+        module = __import__(
+            str(module_name), fromlist=[str('__trash')], level=0,
+        )
+    except Exception:
+        return ()
+    if not hasattr(module, 'PARTIAL_TEMPLATE_CLASS'):
+        return ()
+    functions = vars(module.PARTIAL_TEMPLATE_CLASS)
+    return [
+        local_name for name, local_name in names
+        if name in functions and
+        getattr(getattr(module, name, None), '__wrapped__', None) is
+        functions[name]
+    ]
+
+
 def _arg_chunk_to_text(chunk):
     if chunk[1] is not None:
         return '{0}={1}'.format(*chunk)
@@ -72,6 +149,37 @@ def arg_string_list_to_text(arg_string_list):
     return ', '.join(_arg_chunk_to_text(chunk) for chunk in arg_string_list)
 
 
+def _simple_statement(expr):
+    return expr
+
+
+def _compound_statement(expr):
+    return expr + ':\n    pass'
+
+
+def _except_statement(expr):
+    return 'try:\n    pass\n' + expr + ':\n    pass'
+
+
+# The python statements the compiler parses (see ast_utils) for the
+# expression of these directives.
+AST_STATEMENTS = dict(
+    [
+        (name, _simple_statement) for name in (
+            'py', 'pass', 'del', 'assert', 'raise', 'break', 'continue',
+            'return', 'yield', 'import', 'from',
+        )
+    ] +
+    [('for', _compound_statement), ('with', _compound_statement)] +
+    [('except', _except_statement)]
+)
+
+# Directives which only indent (or dedent and indent) their body
+INDENTING_DIRECTIVES = frozenset((
+    'if', 'else', 'elif', 'for', 'while', 'try', 'except', 'finally', 'with',
+))
+
+
 class MethodCompiler(object):
     def __init__(
             self,
@@ -87,6 +195,7 @@ class MethodCompiler(object):
         self._pendingStrConstChunks = []
         self._methodBodyChunks = []
         self._callRegionsStack = []
+        self._cacheRegionsStack = []
         self._hasReturnStatement = False
         self._isGenerator = False
         self._arguments = [('self', None)]
@@ -237,7 +346,7 @@ class MethodCompiler(object):
     addWhile = addIf = addTry = _add_indenting_directive
 
     def _add_lvalue_indenting_directive(self, expr, line_col):
-        self._update_locals(expr + ':\n    pass')
+        self._update_locals(_compound_statement(expr))
         self._add_indenting_directive(expr, line_col)
 
     addFor = addWith = _add_lvalue_indenting_directive
@@ -256,7 +365,7 @@ class MethodCompiler(object):
     addFinally = addReIndentingDirective
 
     def addExcept(self, expr, line_col, dedent=True):
-        self._update_locals('try:\n    pass\n' + expr + ':\n    pass')
+        self._update_locals(_except_statement(expr))
         self.addReIndentingDirective(expr, line_col, dedent=dedent)
 
     def addElse(self, expr, line_col, dedent=True):
@@ -327,6 +436,55 @@ class MethodCompiler(object):
         )
         self.addChunk()
 
+    def startCacheRegion(self, args, lineCol):
+        positional, keywords = get_call_arguments(args)
+        if positional != 1 or any(keyword != 'ttl' for keyword in keywords):
+            raise AssertionError(
+                '#cache takes a key and an optional ttl: '
+                '#cache key, ttl=seconds',
+            )
+        cache_id = self.next_id()
+        self._cacheRegionsStack.append(CacheDetails(cache_id, lineCol))
+
+        self.addChunk(
+            '## START CACHE REGION: {0} at line {1}, col {2}.'.format(
+                cache_id, *lineCol
+            )
+        )
+        self.addChunk(
+            # Regions with the same key don't share their output
+            '_cache{0} = FRAGMENT_CACHE.lookup(__name__, {1!r}, {2})'.format(
+                cache_id, tuple(lineCol), args,
+            )
+        )
+        self.addChunk('if _cache{0}.value is None:'.format(cache_id))
+        self.indent()
+        self.addChunk('_orig_trans{0} = self.transaction'.format(cache_id))
+        self.addChunk(
+            'self.transaction = _cache_trans{0} = DummyTransaction()'.format(
+                cache_id,
+            )
+        )
+
+    def endCacheRegion(self):
+        cache_id, (line, col) = self._cacheRegionsStack.pop()
+
+        self.addChunk('self.transaction = _orig_trans{0}'.format(cache_id))
+        self.addChunk('del _orig_trans{0}'.format(cache_id))
+        self.addChunk(
+            '_cache{0}.store(_cache_trans{0}.getvalue())'.format(cache_id),
+        )
+        self.addChunk('del _cache_trans{0}'.format(cache_id))
+        self.dedent()
+        self.addChunk('self.transaction.write(_cache{0}.value)'.format(cache_id))
+        self.addChunk('del _cache{0}'.format(cache_id))
+        self.addChunk(
+            '## END CACHE REGION: {0} at line {1}, col {2}.'.format(
+                cache_id, line, col,
+            )
+        )
+        self.addChunk()
+
     def _addAutoSetupCode(self):
         self.addChunk(self._initialMethodComment)
 
@@ -479,6 +637,13 @@ class ClassCompiler(object):
             method.methodDef() for method in self._finishedMethodsList
         )
 
+    def defined_names(self):
+        """Names of the methods and attributes defined by the template."""
+        return set(
+            [method.methodName() for method in self._finishedMethodsList] +
+            [attr.partition(' = ')[0] for attr in self._attrs]
+        )
+
     def attributes(self):
         if self._attrs:
             return '\n'.join(INDENT + attr for attr in self._attrs) + '\n'
@@ -500,8 +665,18 @@ class LegacyCompiler(SettingsManager):
         if source == '':
             warnings.warn('You supplied an empty string for the source!')
 
-        self._parser = self.parserClass(source, compiler=self)
+        self._settings_arg = settings
+        self._parser = self.parserClass(source)
+        self._parsed_template = None
+        # The tree being compiled and the code of its $vars
+        self._tree = None
+        self._cheetah_var_code = []
+        self._parse_counts = {'placeholders': 0, 'directives': 0}
         self._class_compiler = None
+        self._finished_class_compiler = None
+        self._vffsl_count = 0
+        self._namespace_names = set()
+        self._extends_name = None
         self._base_import = 'from Cheetah.Template import {0} as {1}'.format(
             CLASS_NAME, BASE_CLASS_NAME,
         )
@@ -511,6 +686,7 @@ class LegacyCompiler(SettingsManager):
             'from Cheetah.Template import NO_CONTENT',
         ]
         self._global_vars = set(('DummyTransaction', 'NO_CONTENT', 'VFFSL'))
+        self._partial_functions = set()
 
         self._gettext_scannables = []
 
@@ -560,9 +736,20 @@ class LegacyCompiler(SettingsManager):
         if any(nameChunk[0] in self.setting('gettextTokens') for nameChunk in nameChunks):
             self.addGetTextVar(nameChunks, lineCol)
 
-        if plain:
+        name, rest = nameChunks[0]
+        if (
+                plain and
+                name in self._partial_functions and
+                name not in self._local_vars and
+                rest.startswith('(') and
+                not passes_self(rest)
+        ):
+            return genPartialCall(nameChunks)
+        elif plain:
             return genPlainVar(nameChunks)
         else:
+            self._vffsl_count += 1
+            self._namespace_names.add(first_accessed_var)
             return genNameMapperVar(nameChunks)
 
     def addGetTextVar(self, nameChunks, lineCol):
@@ -575,8 +762,14 @@ class LegacyCompiler(SettingsManager):
         scannable += ' # generated from line {0}, col {1}.'.format(*lineCol)
         self._gettext_scannables.append(scannable)
 
+    def startCacheRegion(self, args, lineCol):
+        if CACHE_IMPORT not in self._importStatements:
+            self._importStatements.append(CACHE_IMPORT)
+        self._class_compiler.startCacheRegion(args, lineCol)
+
     def set_extends(self, extends_name):
         self.setMainMethodName('writeBody')
+        self._extends_name = extends_name
 
         if extends_name in self._global_vars:
             raise AssertionError(
@@ -601,16 +794,262 @@ class LegacyCompiler(SettingsManager):
             # the top of the file either
             self._importStatements.append(imp_statement)
         self.addImportedVarNames(imported_names, raw_statement=imp_statement)
+        # The imported names may rebind the names of partial functions
+        self._partial_functions.difference_update(imported_names)
+        if self.setting('directPartialCalls'):
+            self._partial_functions.update(_partial_functions(imp_statement))
 
     addFrom = addImport = _add_import_statement
 
     # methods for module code wrapping
 
-    def getModuleCode(self):
+    def parse(self):
+        """Parses the source into a Cheetah.legacy_parser.ParsedTemplate,
+        compiled by getModuleCode().
+
+        Called by getModuleCode() if it hasn't been called yet.  Sources
+        which were already parsed (by any compiler) aren't parsed again.
+        """
+        if self._parsed_template is None:
+            key = (
+                type(self._parser),
+                hashlib.sha1(self._parser.src().encode('UTF-8')).hexdigest(),
+            )
+            try:
+                self._parsed_template, self._parse_counts = _parse_cache[key]
+            except KeyError:
+                self._raising_first_error(self._parser.parse)
+                self._set_parsed_template()
+                if len(_parse_cache) >= _MAXCACHE:
+                    _parse_cache.clear()
+                _parse_cache[key] = (self._parsed_template, self._parse_counts)
+        return self._parsed_template
+
+    def _raising_first_error(self, func):
+        """Calls `func`, raising the first error of the source if it raises a
+        ParseError.
+
+        The compiler's errors are only found once the whole source is parsed,
+        in its tree: the source is then compiled while it is parsed to report
+        the error found first in the source.
+        """
+        try:
+            return func()
+        except ParseError:
+            exc_info = sys.exc_info()
+        # Outside of the except block not to chain the errors
+        compiler = type(self)(self._parser.src(), settings=self._settings_arg)
+        compiler._compile_while_parsing()
+        six.reraise(*exc_info)  # pragma: no cover (raised again above)
+
+    def _compile_while_parsing(self):
+        self._parser = self.parserClass(self._parser.src(), compiler=self)
+        self._tree = self._parser.parsed_template()
+        self._compile_class(self._parser.parse)
+        self._set_parsed_template()
+
+    def _set_parsed_template(self):
+        self._parsed_template = self._parser.parsed_template()
+        self._parse_counts = {
+            'placeholders': self._parser.placeholder_count,
+            'directives': self._parser.directive_count,
+        }
+
+    def _compile_class(self, compile_methods):
         class_compiler = self._spawnClassCompiler()
+        if self.setting('useSlots'):
+            class_compiler.addAttribute('__slots__ = ()')
         with self._set_class_compiler(class_compiler):
-            self._parser.parse()
+            compile_methods()
             class_compiler.cleanupState()
+        self._finished_class_compiler = class_compiler
+
+    def _resolve(self, arg):
+        """Replaces the $var markers of `arg` by the code of the $vars."""
+        if isinstance(arg, six.text_type):
+            marker = self._tree.marker
+            if marker in arg:
+                parts = arg.split(marker)
+                parts[1::2] = [
+                    self._cheetah_var_code[int(index)] for index in parts[1::2]
+                ]
+                return ''.join(parts)
+            return arg
+        elif isinstance(arg, (tuple, list)):
+            return type(arg)(self._resolve(part) for part in arg)
+        else:
+            return arg
+
+    def _python_expression_error(self, pos, failure_msg):
+        self._parser.setPos(pos)
+        raise ParseError(self._parser, failure_msg)
+
+    def compile_cheetah_var(self, index):
+        """Generates the code of the $var `index` of the tree."""
+        cheetah_var = self._tree.cheetah_vars[index]
+        code = self.genCheetahVar(
+            self._resolve(cheetah_var.nameChunks),
+            cheetah_var.lineCol,
+            plain=cheetah_var.plain,
+        )
+        self._cheetah_var_code.append(code)
+        if cheetah_var.python_only is not None and 'VFFSL(' in code:
+            self._python_expression_error(*cheetah_var.python_only)
+
+    def check_python_expression(self, expr, pos, failure_msg):
+        if 'VFFSL(' in self._resolve(expr):
+            self._python_expression_error(pos, failure_msg)
+
+    def compile_node(self, node):
+        """Generates the code of a node of the tree.  The nodes of the body
+        of a directive are compiled after it.
+        """
+        node_type = type(node)
+        if node_type is Text:
+            self.addStrConst(node.text)
+        elif node_type is Strip:
+            self.handleWSBeforeDirective()
+        elif node_type is Comment:
+            self.addComment(node.text)
+        elif node_type is Placeholder:
+            self.addPlaceholder(
+                self._resolve(node.expr), node.rawPlaceholder, node.lineCol,
+            )
+        elif node_type is Directive:
+            self._compile_directive(node.name, self._resolve(node.args), node.short)
+        else:
+            assert node_type is End, node
+            self._compile_end(node.name, node.short)
+
+    def _compile_directive(self, name, args, short):
+        if name in ('def', 'block'):
+            self.startMethodDef(*args)
+        elif name == 'call':
+            self.startCallRegion(*args)
+        elif name == 'cache':
+            self.startCacheRegion(*args)
+        elif name == 'attr':
+            self.addAttribute(*args)
+        elif name == '@':
+            self.addDecorator(*args)
+        elif name == 'extends':
+            self.set_extends(*args)
+        elif name == 'implements':
+            self.setMainMethodName(*args)
+        elif name == 'super':
+            self.addSuper(*args)
+        elif name == 'slurp':
+            self.commitStrConst()
+        elif name == 'compiler-settings':
+            pass  # See _compile_end()
+        elif short and name in ('else', 'elif', 'except', 'finally'):
+            getattr(self, 'add' + name.capitalize())(*args, dedent=False)
+        else:
+            assert name in INDENTING_DIRECTIVES or name in AST_STATEMENTS, name
+            getattr(self, 'add' + name.capitalize())(*args)
+
+    def _compile_end(self, name, short):
+        if name == 'def':
+            self.closeDef()
+        elif name == 'block':
+            self.closeBlock()
+        elif name == 'call':
+            self.endCallRegion()
+        elif name == 'cache':
+            self.endCacheRegion()
+        elif name == 'compiler-settings' and not short:
+            self.add_compiler_settings()
+        else:
+            self.commitStrConst()
+            self.dedent()
+
+    def _replay(self, parsed_template):
+        """Generates the code of the class' methods from the tree of the
+        source.
+        """
+        self._tree = parsed_template
+        marker = parsed_template.marker
+
+        # Parse the python statements of the directives in one go.  The ones
+        # containing $vars are only known once they are generated.
+        parse_batch(
+            AST_STATEMENTS[node.name](node.args[0])
+            for node in iter_nodes(parsed_template.nodes)
+            if type(node) is Directive and node.name in AST_STATEMENTS and
+            marker not in node.args[0]
+        )
+
+        cheetah_vars = parsed_template.cheetah_vars
+        for node_count, node in enumerate(iter_nodes(parsed_template.nodes)):
+            try:
+                # Generate the $vars found before the node, in the state the
+                # compiler was in when they were found.
+                while (
+                        len(self._cheetah_var_code) < len(cheetah_vars) and
+                        cheetah_vars[len(self._cheetah_var_code)].node_count <=
+                        node_count
+                ):
+                    self.compile_cheetah_var(len(self._cheetah_var_code))
+                self.compile_node(node)
+            except ParseError:
+                raise
+            except Exception as e:
+                # Report the error where the parser made the node
+                self._parser.setPos(node.pos)
+                six.reraise(
+                    ParseError,
+                    ParseError(
+                        self._parser,
+                        '{0}: {1}\n'.format(type(e).__name__, e),
+                    ),
+                    sys.exc_info()[2],
+                )
+        while len(self._cheetah_var_code) < len(cheetah_vars):
+            self.compile_cheetah_var(len(self._cheetah_var_code))
+
+    def get_counts(self):
+        """Returns counts of the constructs found in the parsed source."""
+        counts = dict(self._parse_counts)
+        counts['vffsl_sites'] = self._vffsl_count
+        return counts
+
+    def get_namespace_names(self):
+        """Returns the names the template looks up in the namespace (besides
+        those of the template it extends) and the name of that template.
+
+        Only meaningful after getModuleCode().
+        """
+        return {
+            'namespace_names': sorted(
+                self._namespace_names -
+                self._finished_class_compiler.defined_names()
+            ),
+            'extends': self._extends_name,
+        }
+
+    def _namespace_names_def(self):
+        return (
+            '# Names looked up in the namespace by this template and its bases\n'
+            '__CHEETAH_namespace_names__ = {0}.__CHEETAH_namespace_names__ = '
+            'frozenset(\n'
+            '    name\n'
+            '    for name in {1}.__CHEETAH_namespace_names__.union({2})\n'
+            '    if not hasattr({0}, name)\n'
+            ')\n'
+        ).format(
+            CLASS_NAME,
+            BASE_CLASS_NAME,
+            repr(tuple(str(name) for name in sorted(self._namespace_names))),
+        )
+
+    def getModuleCode(self):
+        parsed_template = self.parse()
+        if self._finished_class_compiler is None:
+            self._raising_first_error(functools.partial(
+                self._compile_class,
+                functools.partial(self._replay, parsed_template),
+            ))
+        class_compiler = self._finished_class_compiler
 
         moduleDef = textwrap.dedent(
             """
@@ -626,6 +1065,8 @@ class LegacyCompiler(SettingsManager):
 
             {class_def}
 
+
+            {namespace_names}
             {scannables}
             if __name__ == '__main__':
                 from os import environ
@@ -636,6 +1077,7 @@ class LegacyCompiler(SettingsManager):
             imports='\n'.join(self._importStatements),
             base_import=self._base_import,
             class_def=class_compiler.class_def(),
+            namespace_names=self._namespace_names_def(),
             scannables=self.gettext_scannables(),
             class_name=CLASS_NAME,
         ) + '\n'
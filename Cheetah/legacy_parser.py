@@ -5,9 +5,11 @@ Classes:
   ParseError(Exception)
   _LowLevelParser(Cheetah.SourceReader.SourceReader), basically a lexer
   LegacyParser(_LowLevelParser)
+  TreeBuilder, builds the ParsedTemplate handed to the compiler
 """
 from __future__ import unicode_literals
 
+import collections
 import functools
 import re
 import string
@@ -62,6 +64,7 @@ for start_part, end_part in tripleQuotedStringPairs.items():
 
 escCharLookBehind = r'(?:(?<=\A)|(?<!\\))'
 identRE = re.compile(r'[a-zA-Z_][a-zA-Z_0-9]*')
+dottedNameRE = re.compile(r'[a-zA-Z_][a-zA-Z_0-9]*(?:\.[a-zA-Z_][a-zA-Z_0-9]*)*')
 directiveRE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_-]*|@[a-zA-Z_][a-zA-Z0-9_]*)')
 EOLre = re.compile(r'(?:\r\n|\r|\n)')
 
@@ -83,17 +86,23 @@ VAR_START_TOKEN_RE = re.compile(
 VAR_IN_EXPRESSION_START_TOKEN_RE = re.compile(
     VAR_START_ESC + r'(?=[A-Za-z_])'
 )
-EXPR_PLACEHOLDER_START_RE = re.compile(
-    escCharLookBehind +
-    r'(?P<startToken>' + VAR_START_ESC + ')' +
-    r'(?:\{|\(|\[)[ \t]*'
-    r'(?=[^\)\}\]])'
-)
 COMMENT_START_RE = re.compile(escCharLookBehind + re.escape('##'))
 DIRECTIVE_START_RE = re.compile(
     escCharLookBehind + re.escape('#') + r'(?=[A-Za-z_@])',
 )
 DIRECTIVE_END_RE = re.compile(escCharLookBehind + re.escape('#'))
+# One alternation for everything which can start at the top level (outside
+# of directives and placeholders), in order of precedence.  The group which
+# matched names the token.
+TOP_LEVEL_TOKEN_RE = re.compile(
+    escCharLookBehind + '(?:' +
+    r'(?P<comment>##)|' +
+    # A $var, ${var} or an expression placeholder such as $(1 + 2)
+    r'(?P<placeholder>' + VAR_START_ESC +
+    r'(?:(?=[A-Za-z_])|(?:\{|\(|\[)[ \t]*(?=[^\)\}\]])))|' +
+    r'(?P<directive>#(?=[A-Za-z_@]))' +
+    ')'
+)
 
 
 def _unescapeCheetahVars(s):
@@ -138,6 +147,7 @@ directiveNamesAndParsers = {
     'slurp': 'eatSlurp',
     'py': None,
     'call': 'eatCall',
+    'cache': 'eatCache',
     'attr': 'eatAttr',
     'block': 'eatBlock',
     'end': 'eatEndDirective',
@@ -148,6 +158,7 @@ endDirectiveNamesAndHandlers = {
     'compiler-settings': None,
     'block': None,
     'call': None,
+    'cache': None,
     'while': None,
     'for': None,
     'if': None,
@@ -170,7 +181,7 @@ class ParseError(ValueError):
         row, col, line = self.stream.getRowColLine()
 
         # get the surrounding lines
-        lines = stream._srcLines
+        lines = stream.src().splitlines()
         prevLines = []                  # (rowNum, content)
         for i in range(1, 4):
             if row - 1 - i < 0:
@@ -258,26 +269,18 @@ class _LowLevelParser(SourceReader):
     """
 
     def matchTopLevelToken(self):
-        """Returns the first match found from the following methods:
-            self.matchCommentStartToken
-            self.matchVariablePlaceholderStart
-            self.matchExpressionPlaceholderStart
-            self.matchDirective
+        """Returns the name of the token at the current position: 'comment',
+        'placeholder' or 'directive'.
 
         Returns None if no match.
         """
-        match = None
-        if self.peek() in '#$':
-            for matcher in (
-                    self.matchCommentStartToken,
-                    self.matchVariablePlaceholderStart,
-                    self.matchExpressionPlaceholderStart,
-                    self.matchDirective,
-            ):
-                match = matcher()
-                if match:
-                    break
-        return match
+        match = TOP_LEVEL_TOKEN_RE.match(self.src(), self.pos())
+        if match is None:
+            return None
+        elif match.lastgroup == 'directive' and not self.matchDirective():
+            return None
+        else:
+            return match.lastgroup
 
     def matchPyToken(self):
         match = python_token_re.match(self.src(), self.pos())
@@ -304,25 +307,9 @@ class _LowLevelParser(SourceReader):
         return self.readTo(match.end())
 
     def getDottedName(self):
-        srcLen = len(self)
-        nameChunks = []
-
-        assert self.peek() in identchars
-
-        while self.pos() < srcLen:
-            c = self.peek()
-            if c in namechars:
-                nameChunk = self.getIdentifier()
-                nameChunks.append(nameChunk)
-            elif c == '.':
-                if self.pos() + 1 < srcLen and self.peek(1) in identchars:
-                    nameChunks.append(self.getc())
-                else:
-                    break
-            else:
-                break
-
-        return ''.join(nameChunks)
+        match = dottedNameRE.match(self.src(), self.pos(), len(self))
+        assert match, self.peek()
+        return self.readTo(match.end())
 
     def matchIdentifier(self):
         return identRE.match(self.src(), self.pos())
@@ -402,14 +389,6 @@ class _LowLevelParser(SourceReader):
         """no enclosures"""
         return VAR_IN_EXPRESSION_START_TOKEN_RE.match(self.src(), self.pos())
 
-    def matchVariablePlaceholderStart(self):
-        """includes the enclosure"""
-        return VAR_START_RE.match(self.src(), self.pos())
-
-    def matchExpressionPlaceholderStart(self):
-        """includes the enclosure"""
-        return EXPR_PLACEHOLDER_START_RE.match(self.src(), self.pos())
-
     def getCheetahVarStartToken(self):
         """just the start token, not the enclosure"""
         match = self.matchCheetahVarStartToken()
@@ -424,7 +403,7 @@ class _LowLevelParser(SourceReader):
     def getCheetahVarBody(self, plain=False):
         # @@TR: this should be in the compiler
         lineCol = self.getRowCol()
-        return self._compiler.genCheetahVar(self.getCheetahVarNameChunks(), lineCol, plain=plain)
+        return self._builder.cheetah_var(self.getCheetahVarNameChunks(), lineCol, plain=plain)
 
     def getCheetahVarNameChunks(self):
         """nameChunks = list of Cheetah $var subcomponents represented as tuples
@@ -722,9 +701,7 @@ class _LowLevelParser(SourceReader):
         """
         expr_pos = self.pos()
         expr = self.getExpression(**kwargs)
-        if 'VFFSL(' in expr:
-            self.setPos(expr_pos)
-            raise ParseError(self, failure_msg)
+        self._builder.python_expression(expr, expr_pos, failure_msg)
         return expr
 
     def _raiseErrorAboutInvalidCheetahVarSyntaxInExpr(self):
@@ -752,7 +729,7 @@ class _LowLevelParser(SourceReader):
 
         if self.matchIdentifier():
             nameChunks = self.getCheetahVarNameChunks()
-            expr = self._compiler.genCheetahVar(nameChunks[:], lineCol, plain=plain)
+            expr = self._builder.cheetah_var(nameChunks[:], lineCol, plain=plain)
             restOfExpr = None
             if enclosures:
                 whitespace = self.getWhiteSpace()
@@ -774,16 +751,156 @@ class _LowLevelParser(SourceReader):
         return expr, rawPlaceholder, lineCol
 
 
+# The template's tree.  `nodes` is the body of the template.  The $vars of
+# the expressions found in the nodes are replaced by `marker` + the index
+# of the CheetahVar in `cheetah_vars` + `marker`: the code generated for a
+# $var depends on the state of the compiler (locals, imports,
+# #compiler-settings).
+ParsedTemplate = collections.namedtuple(
+    'ParsedTemplate', ['marker', 'cheetah_vars', 'nodes'],
+)
+
+# Nodes.  `pos` is the position of the parser when it made the node, errors
+# compiling the node are reported there.
+Text = collections.namedtuple('Text', ['pos', 'text'])
+# The line of the following directive or comment only contains it: the
+# whitespace starting the line isn't output.
+Strip = collections.namedtuple('Strip', ['pos'])
+Comment = collections.namedtuple('Comment', ['pos', 'text'])
+Placeholder = collections.namedtuple(
+    'Placeholder', ['pos', 'expr', 'rawPlaceholder', 'lineCol'],
+)
+# `args` depend on the directive `name`, `body` is None for directives
+# without a body (#import, #else, #attr, ...).  `short` is true for the
+# single line form (`#if x: $y`).
+Directive = collections.namedtuple(
+    'Directive', ['pos', 'name', 'args', 'short', 'body'],
+)
+# The last node of the body of a directive (the body of a single line
+# directive may start a directive which is ended later on, the End is then
+# in the body of that directive).
+End = collections.namedtuple('End', ['pos', 'name', 'short'])
+
+# A $var, found after the first `node_count` nodes.  `python_only` is None,
+# or the position and the message of the ParseError raised when the var is
+# in a python expression (see get_python_expression) yet it isn't compiled
+# to plain python.
+CheetahVar = collections.namedtuple(
+    'CheetahVar',
+    ['node_count', 'nameChunks', 'lineCol', 'plain', 'python_only'],
+)
+
+
+def iter_nodes(nodes):
+    """Yields the nodes and the nodes of their bodies, in source order."""
+    for node in nodes:
+        yield node
+        if type(node) is Directive and node.body is not None:
+            for child in iter_nodes(node.body):
+                yield child
+
+
+def _marker_char(src):
+    """A character (from the private use area) which isn't in the source."""
+    for codepoint in six.moves.range(0xE000, 0xF900):
+        char = six.unichr(codepoint)
+        if char not in src:
+            return char
+    raise AssertionError('No marker character available')
+
+
+class TreeBuilder(object):
+    """Builds the ParsedTemplate of the parser.
+
+    The nodes are handed to the `compiler` (if any) as they are made, so the
+    compiler's errors are raised while parsing, where they are found.
+    """
+
+    def __init__(self, stream, compiler=None):
+        self._stream = stream
+        self._compiler = compiler
+        self.parsed_template = ParsedTemplate(
+            _marker_char(stream.src()), [], [],
+        )
+        self._node_count = 0
+        # (name, short, body) of the open directives, innermost last
+        self._open = [(None, False, self.parsed_template.nodes)]
+
+    def _add(self, node):
+        self._open[-1][2].append(node)
+        self._node_count += 1
+        if self._compiler is not None:
+            self._compiler.compile_node(node)
+
+    def text(self, text):
+        self._add(Text(self._stream.pos(), text))
+
+    def strip(self):
+        self._add(Strip(self._stream.pos()))
+
+    def comment(self, comment):
+        self._add(Comment(self._stream.pos(), comment))
+
+    def placeholder(self, expr, rawPlaceholder, lineCol):
+        self._add(Placeholder(self._stream.pos(), expr, rawPlaceholder, lineCol))
+
+    def directive(self, name, args):
+        self._add(Directive(self._stream.pos(), name, args, False, None))
+
+    def start(self, name, args, short=False):
+        """Starts a directive with a body, see end()."""
+        body = []
+        self._add(Directive(self._stream.pos(), name, args, short, body))
+        self._open.append((name, short, body))
+
+    def end(self, name, short=False):
+        self._add(End(self._stream.pos(), name, short))
+        # The parser checks #end's match the directives they end
+        for i in reversed(range(1, len(self._open))):
+            if self._open[i][1] == short:
+                assert self._open[i][0] == name, (self._open[i][0], name)
+                del self._open[i]
+                return
+        raise AssertionError('Nothing to end')
+
+    def cheetah_var(self, nameChunks, lineCol, plain=False):
+        cheetah_vars = self.parsed_template.cheetah_vars
+        marker = '{0}{1}{0}'.format(
+            self.parsed_template.marker, len(cheetah_vars),
+        )
+        cheetah_vars.append(
+            CheetahVar(self._node_count, nameChunks, lineCol, plain, None),
+        )
+        if self._compiler is not None:
+            self._compiler.compile_cheetah_var(len(cheetah_vars) - 1)
+        return marker
+
+    def python_expression(self, expr, pos, failure_msg):
+        """Records that the $vars of `expr` must compile to plain python."""
+        marker = self.parsed_template.marker
+        cheetah_vars = self.parsed_template.cheetah_vars
+        for index in expr.split(marker)[1::2]:
+            index = int(index)
+            if cheetah_vars[index].python_only is None:
+                cheetah_vars[index] = cheetah_vars[index]._replace(
+                    python_only=(pos, failure_msg),
+                )
+        if self._compiler is not None:
+            self._compiler.check_python_expression(expr, pos, failure_msg)
+
+
 class LegacyParser(_LowLevelParser):
-    """This class is a StateMachine for parsing Cheetah source and
-    sending state dependent code generation commands to
+    """This class is a StateMachine for parsing Cheetah source into a
+    ParsedTemplate (see TreeBuilder), compiled by
     Cheetah.legacy_compiler.LegacyCompiler
     """
 
-    def __init__(self, src, compiler):
+    def __init__(self, src, compiler=None):
         super(LegacyParser, self).__init__(src)
-        self._compiler = compiler
+        self._builder = TreeBuilder(self, compiler)
         self._openDirectivesStack = []
+        self.placeholder_count = 0
+        self.directive_count = 0
 
         def normalizeParserVal(val):
             if isinstance(val, six.text_type):
@@ -806,8 +923,8 @@ class LegacyParser(_LowLevelParser):
             self._endDirectiveNamesAndHandlers[name] = normalizeHandlerVal(val)
 
         self._closeableDirectives = [
-            'compiler-settings', 'def', 'block', 'call', 'filter', 'if',
-            'for', 'while', 'try', 'with',
+            'compiler-settings', 'def', 'block', 'call', 'cache', 'filter',
+            'if', 'for', 'while', 'try', 'with',
         ]
 
     @fail_with_our_parse_error
@@ -818,13 +935,12 @@ class LegacyParser(_LowLevelParser):
             assertEmptyStack = False
 
         while not self.atEnd():
-            if self.matchCommentStartToken():
+            token = self.matchTopLevelToken()
+            if token == 'comment':
                 self.eatComment()
-            elif self.matchVariablePlaceholderStart():
-                self.eatPlaceholder()
-            elif self.matchExpressionPlaceholderStart():
+            elif token == 'placeholder':
                 self.eatPlaceholder()
-            elif self.matchDirective():
+            elif token == 'directive':
                 self.eatDirective()
             else:
                 self.eatPlainText()
@@ -837,22 +953,31 @@ class LegacyParser(_LowLevelParser):
 
     def eatPlainText(self):
         start = self.pos()
-        while not self.atEnd() and not self.matchTopLevelToken():
-            self.advance()
-        text = self.readTo(self.pos(), start=start)
+        src = self.src()
+        breakPoint = self.breakPoint()
+        end = breakPoint
+        match = TOP_LEVEL_TOKEN_RE.search(src, start)
+        while match is not None and match.start() < breakPoint:
+            self.setPos(match.start())
+            if self.matchTopLevelToken():
+                end = match.start()
+                break
+            match = TOP_LEVEL_TOKEN_RE.search(src, match.start() + 1)
+        text = self.readTo(end, start=start)
         text = _unescapeDirectives(_unescapeCheetahVars(text))
-        self._compiler.addStrConst(text)
+        self._builder.text(text)
 
     def eatComment(self):
         isLineClearToStartToken = self.isLineClearToStartToken()
         if isLineClearToStartToken:
-            self._compiler.handleWSBeforeDirective()
+            self._builder.strip()
         self.getCommentStartToken()
         comm = self.readToEOL(gobble=isLineClearToStartToken)
-        self._compiler.addComment(comm)
+        self._builder.comment(comm)
 
     def eatPlaceholder(self):
-        self._compiler.addPlaceholder(*self.getPlaceholder())
+        self.placeholder_count += 1
+        self._builder.placeholder(*self.getPlaceholder())
 
     _simpleIndentingDirectives = frozenset((
         'compiler-settings', 'if', 'else', 'elif', 'for', 'while', 'try',
@@ -864,6 +989,7 @@ class LegacyParser(_LowLevelParser):
     ))
 
     def eatDirective(self):
+        self.directive_count += 1
         directive = self.matchDirective()
 
         # subclasses can override the default behaviours here by providing an
@@ -871,23 +997,16 @@ class LegacyParser(_LowLevelParser):
         directiveParser = self._directiveNamesAndParsers.get(directive)
         if directiveParser:
             directiveParser()
+        elif directive in self._simpleIndentingDirectives:
+            self.eatSimpleIndentingDirective(directive)
         else:
-            if directive == 'compiler-settings':
-                def handler(*_):
-                    pass
-            else:
-                handler = getattr(self._compiler, 'add' + directive.capitalize())
-
-            if directive in self._simpleIndentingDirectives:
-                self.eatSimpleIndentingDirective(directive, callback=handler)
-            else:
-                assert directive in self._simple_expr_directives
-                line_col = self.getRowCol()
-                include_name = directive != 'py'
-                expr = self.eatSimpleExprDirective(
-                    directive, include_name=include_name,
-                )
-                handler(expr, line_col=line_col)
+            assert directive in self._simple_expr_directives
+            line_col = self.getRowCol()
+            include_name = directive != 'py'
+            expr = self.eatSimpleExprDirective(
+                directive, include_name=include_name,
+            )
+            self._builder.directive(directive, (expr, line_col))
 
     def _eatRestOfDirectiveTag(self, isLineClearToStartToken, endOfFirstLinePos):
         foundComment = False
@@ -924,7 +1043,7 @@ class LegacyParser(_LowLevelParser):
             self.readToEOL(gobble=True)
 
         if isLineClearToStartToken and (self.atEnd() or self.pos() > endOfFirstLinePos):
-            self._compiler.handleWSBeforeDirective()
+            self._builder.strip()
 
     def eatSimpleExprDirective(self, directive, include_name=True):
         isLineClearToStartToken = self.isLineClearToStartToken()
@@ -936,7 +1055,7 @@ class LegacyParser(_LowLevelParser):
         self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLine)
         return expr
 
-    def eatSimpleIndentingDirective(self, directiveName, callback):
+    def eatSimpleIndentingDirective(self, directiveName):
         isLineClearToStartToken = self.isLineClearToStartToken()
         endOfFirstLinePos = self.findEOL()
         lineCol = self.getRowCol()
@@ -946,15 +1065,10 @@ class LegacyParser(_LowLevelParser):
         expr = self.getExpression(pyTokensToBreakAt=[':'])
         if self.matchColonForSingleLineShortFormDirective():
             self.advance()  # skip over :
-            if directiveName in 'else elif except finally'.split():
-                callback(expr, lineCol, dedent=False)
-            else:
-                callback(expr, lineCol)
-
+            self._builder.start(directiveName, (expr, lineCol), short=True)
             self.getWhiteSpace(maximum=1)
             self.parse(breakPoint=self.findEOL(gobble=True))
-            self._compiler.commitStrConst()
-            self._compiler.dedent()
+            self._builder.end(directiveName, short=True)
         else:
             if self.peek() == ':':
                 self.advance()
@@ -962,17 +1076,18 @@ class LegacyParser(_LowLevelParser):
             self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLinePos)
             if directiveName in self._closeableDirectives:
                 self.pushToOpenDirectivesStack(directiveName)
-            callback(expr, lineCol)
+                self._builder.start(directiveName, (expr, lineCol))
+            else:
+                self._builder.directive(directiveName, (expr, lineCol))
 
     def eatEndDirective(self):
         isLineClearToStartToken = self.isLineClearToStartToken()
         self.getDirectiveStartToken()
         self.advance(len('end'))
         self.getWhiteSpace()
-        pos = self.pos()
         directiveName = False
         for key in self._endDirectiveNamesAndHandlers.keys():
-            if self.find(key, pos) == pos:
+            if self.startswith(key):
                 directiveName = key
                 break
         if not directiveName:
@@ -989,16 +1104,8 @@ class LegacyParser(_LowLevelParser):
         if self._endDirectiveNamesAndHandlers.get(directiveName):
             handler = self._endDirectiveNamesAndHandlers[directiveName]
             handler()
-        elif directiveName == 'compiler-settings':
-            self._compiler.add_compiler_settings()
-        elif directiveName == 'block':
-            self._compiler.closeBlock()
-        elif directiveName == 'call':
-            self._compiler.endCallRegion()
         else:
-            assert directiveName in ['while', 'for', 'if', 'try', 'with']
-            self._compiler.commitStrConst()
-            self._compiler.dedent()
+            self._builder.end(directiveName)
 
     # specific directive eat methods
     def eatAttr(self):
@@ -1018,7 +1125,7 @@ class LegacyParser(_LowLevelParser):
             'Invalid #attr directive. '
             'It should contain simple Python literals.'
         )
-        self._compiler.addAttribute(attribName + ' = ' + expr)
+        self._builder.directive('attr', (attribName + ' = ' + expr,))
         self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLinePos)
 
     def eatDecorator(self):
@@ -1031,7 +1138,7 @@ class LegacyParser(_LowLevelParser):
             raise ParseError(
                 self, '@classmethod / @staticmethod are not supported',
             )
-        self._compiler.addDecorator(decorator_expr)
+        self._builder.directive('@', (decorator_expr,))
         self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLinePos)
         self.getWhiteSpace()
 
@@ -1085,16 +1192,14 @@ class LegacyParser(_LowLevelParser):
         if self.matchColonForSingleLineShortFormDirective():
             self.getc()
             self._eatSingleLineDef(
+                directiveName=directiveName,
                 methodName=methodName,
                 argsList=argsList,
                 startPos=startPos,
                 endPos=endOfFirstLinePos,
             )
-            if directiveName == 'def':
-                # @@TR: must come before _eatRestOfDirectiveTag ... for some reason
-                self._compiler.closeDef()
-            else:
-                self._compiler.closeBlock()
+            # @@TR: must come before _eatRestOfDirectiveTag ... for some reason
+            self._builder.end(directiveName, short=True)
 
             self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLinePos)
         else:
@@ -1102,13 +1207,14 @@ class LegacyParser(_LowLevelParser):
                 self.getc()
             self.pushToOpenDirectivesStack(directiveName)
             self._eatMultiLineDef(
+                directiveName=directiveName,
                 methodName=methodName,
                 argsList=argsList,
                 startPos=startPos,
                 isLineClearToStartToken=isLineClearToStartToken,
             )
 
-    def _eatMultiLineDef(self, methodName, argsList, startPos, isLineClearToStartToken=False):
+    def _eatMultiLineDef(self, directiveName, methodName, argsList, startPos, isLineClearToStartToken=False):
         self.getExpression()  # slurp up any garbage left at the end
         signature = self[startPos:self.pos()]
         endOfFirstLinePos = self.findEOL()
@@ -1118,14 +1224,16 @@ class LegacyParser(_LowLevelParser):
                          ' at line %s, col %s' % self.getRowCol(startPos) +
                          '.')
 
-        self._compiler.startMethodDef(methodName, argsList, parserComment)
+        self._builder.start(directiveName, (methodName, argsList, parserComment))
 
-    def _eatSingleLineDef(self, methodName, argsList, startPos, endPos):
+    def _eatSingleLineDef(self, directiveName, methodName, argsList, startPos, endPos):
         fullSignature = self[startPos:endPos]
         parserComment = ('## Generated from ' + fullSignature +
                          ' at line %s, col %s' % self.getRowCol(startPos) +
                          '.')
-        self._compiler.startMethodDef(methodName, argsList, parserComment)
+        self._builder.start(
+            directiveName, (methodName, argsList, parserComment), short=True,
+        )
 
         self.getWhiteSpace(maximum=1)
         self.parse(breakPoint=endPos)
@@ -1143,7 +1251,7 @@ class LegacyParser(_LowLevelParser):
                 self, 'yelp_cheetah does not support multiple inheritance'
             )
 
-        self._compiler.set_extends(extends_value)
+        self._builder.directive('extends', (extends_value,))
         self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLine)
 
     def eatImplements(self):
@@ -1157,7 +1265,7 @@ class LegacyParser(_LowLevelParser):
             raise ParseError(
                 self, 'yelp_cheetah does not support argspecs for #implements',
             )
-        self._compiler.setMainMethodName(methodName)
+        self._builder.directive('implements', (methodName,))
 
         self.getExpression()  # throw away and unwanted crap that got added in
         self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLine)
@@ -1178,12 +1286,12 @@ class LegacyParser(_LowLevelParser):
 
         self.getExpression()  # throw away and unwanted crap that got added in
         self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLine)
-        self._compiler.addSuper(argsList)
+        self._builder.directive('super', (argsList,))
 
     def eatSlurp(self):
         if self.isLineClearToStartToken():
-            self._compiler.handleWSBeforeDirective()
-        self._compiler.commitStrConst()
+            self._builder.strip()
+        self._builder.directive('slurp', ())
         self.readToEOL(gobble=True)
 
     def eatCall(self):
@@ -1203,21 +1311,48 @@ class LegacyParser(_LowLevelParser):
         args = self.getExpression(pyTokensToBreakAt=[':']).strip()
         if self.matchColonForSingleLineShortFormDirective():
             self.advance()  # skip over :
-            self._compiler.startCallRegion(functionName, args, lineCol)
+            self._builder.start(
+                'call', (functionName, args, lineCol), short=True,
+            )
             self.getWhiteSpace(maximum=1)
             self.parse(breakPoint=self.findEOL(gobble=False))
-            self._compiler.endCallRegion()
+            self._builder.end('call', short=True)
         else:
             if self.peek() == ':':
                 self.advance()
             self.getWhiteSpace()
             self.pushToOpenDirectivesStack("call")
             self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLinePos)
-            self._compiler.startCallRegion(functionName, args, lineCol)
+            self._builder.start('call', (functionName, args, lineCol))
+
+    def eatCache(self):
+        isLineClearToStartToken = self.isLineClearToStartToken()
+        endOfFirstLinePos = self.findEOL()
+        lineCol = self.getRowCol()
+        self.getDirectiveStartToken()
+        self.advance(len('cache'))
+
+        self.getWhiteSpace()
+        args = self.getExpression(pyTokensToBreakAt=[':']).strip()
+        if not args:
+            raise ParseError(self, '#cache requires a key')
+        if self.matchColonForSingleLineShortFormDirective():
+            self.advance()  # skip over :
+            self._builder.start('cache', (args, lineCol), short=True)
+            self.getWhiteSpace(maximum=1)
+            self.parse(breakPoint=self.findEOL(gobble=False))
+            self._builder.end('cache', short=True)
+        else:
+            if self.peek() == ':':
+                self.advance()
+            self.getWhiteSpace()
+            self.pushToOpenDirectivesStack('cache')
+            self._eatRestOfDirectiveTag(isLineClearToStartToken, endOfFirstLinePos)
+            self._builder.start('cache', (args, lineCol))
 
     # end directive handlers
     def handleEndDef(self):
-        self._compiler.closeDef()
+        self._builder.end('def')
 
     def pushToOpenDirectivesStack(self, directiveName):
         assert directiveName in self._closeableDirectives
@@ -1234,6 +1369,10 @@ class LegacyParser(_LowLevelParser):
                 '#end {0} found, expected #end {1}'.format(directive_name, last)
             )
 
+    def parsed_template(self):
+        """Returns the ParsedTemplate built by parse()."""
+        return self._builder.parsed_template
+
     def assertEmptyOpenDirectivesStack(self):
         if self._openDirectivesStack:
             errorMsg = (
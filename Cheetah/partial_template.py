@@ -6,6 +6,11 @@ import inspect
 import sys
 import types
 
+import _cheetah
+
+from Cheetah.cache import LRUCache
+from Cheetah.DummyTransaction import DummyTransaction
+from Cheetah.Template import NO_CONTENT
 from Cheetah.Template import Template
 
 
@@ -24,15 +29,19 @@ def _raise_not_called_from_template():
     )
 
 
-def default_self(func):
+def py_default_self(func):
     """Decorates the given template function.
 
     If explicit 'self' is passed into the function it is used.
     Otherwise the function looks for self in the previous stack frame.
+
+    While a profiler is active, the calls are counted in `.calls`.
     """
 
     @functools.wraps(func)
     def default_self_wrapper(self=NO_ARGUMENT, *args, **kwargs):
+        if sys.getprofile() is not None:
+            default_self_wrapper.calls += 1
         if not isinstance(self, Template):
             if not (
                     self is NO_ARGUMENT or
@@ -69,9 +78,86 @@ def default_self(func):
         finally:
             del self
 
+    # Templates calling the function directly (see `directPartialCalls`)
+    # pass `self` themselves.  python 2's functools.wraps doesn't set this.
+    default_self_wrapper.__wrapped__ = func
+    default_self_wrapper.calls = 0
     return default_self_wrapper
 
 
+def c_default_self(func):
+    """Same as `py_default_self`, with the wrapper implemented in C."""
+    wrapper = _cheetah.DefaultSelf(
+        func, Template, _raise_not_called_from_template,
+    )
+    functools.update_wrapper(wrapper, func)
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+if '__pypy__' in sys.builtin_module_names:  # pragma: no cover
+    default_self = py_default_self
+else:  # pragma: no cover
+    default_self = c_default_self
+
+
+def memoize(maxsize=128):
+    """Memoizes the output of a partial template function by its arguments,
+    for functions rendering the same for the same arguments (whichever
+    template calls them):
+
+        #from Cheetah.partial_template import memoize
+        #@memoize(maxsize=1000)
+        #def render(business)
+
+    Arguments of different types are memoized separately (like
+    `functools.lru_cache(typed=True)`).  Calls with unhashable arguments are
+    not memoized (counted in `.bypassed`).  The hits, misses and evictions of
+    the LRU cache are counted in `.cache`.
+    """
+    def decorator(func):
+        cache = LRUCache(maxsize=maxsize)
+
+        @functools.wraps(func)
+        def memoized(self, *args, **kwargs):
+            try:
+                # Typed: 1, 1.0 and True are equal but render differently
+                key = (
+                    tuple((arg, type(arg)) for arg in args),
+                    frozenset(
+                        (name, value, type(value))
+                        for name, value in kwargs.items()
+                    ),
+                )
+                rendered = cache.get(key)
+            except TypeError:
+                memoized.bypassed += 1
+                return func(self, *args, **kwargs)
+
+            if rendered is None:
+                # Capture what the function writes to the transaction
+                transaction = self.transaction
+                self.transaction = DummyTransaction()
+                try:
+                    ret = func(self, *args, **kwargs)
+                    rendered = (ret, self.transaction.getvalue())
+                finally:
+                    self.transaction = transaction
+                cache.set(key, rendered)
+
+            ret, output = rendered
+            if self.transaction is None:
+                return output if ret is NO_CONTENT else ret
+            else:
+                self.transaction.write(output)
+                return ret
+
+        memoized.cache = cache
+        memoized.bypassed = 0
+        return memoized
+    return decorator
+
+
 class PartialTemplateType(type):
     """Metaclass for partial templates.
 
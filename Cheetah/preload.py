@@ -0,0 +1,95 @@
+"""Preloading of compiled templates for pre-forking servers.
+
+Workers forked from a master which already imported every template share
+those modules (copy-on-write) instead of each importing them lazily.
+"""
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import collections
+import gc
+import pkgutil
+import timeit
+
+from Cheetah.legacy_compiler import CLASS_NAME
+
+try:
+    import resource
+except ImportError:  # pragma: no cover (not posix)
+    resource = None
+
+
+PreloadReport = collections.namedtuple(
+    'PreloadReport',
+    ['modules', 'templates', 'seconds', 'max_rss_kb', 'frozen_objects'],
+)
+
+
+def trivial(_):
+    return True
+
+
+def discover_modules(package, module_match_func=trivial):
+    """Yields modules matching module_match_func
+
+    :param package: A python package (something with __init__.py)
+    :param module_match_func: Function taking a module and returning True if
+        the module is to be included in the output.
+    """
+    for _, module_name, _ in pkgutil.walk_packages(
+            package.__path__,
+            prefix=package.__name__ + '.',
+    ):
+        module = __import__(module_name, fromlist=[str('__trash')], level=0)
+        if module_match_func(module):
+            yield module
+
+
+def is_template_module(module):
+    return hasattr(module, '__YELP_CHEETAH__')
+
+
+def _max_rss_kb():
+    if resource is None:  # pragma: no cover (not posix)
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def preload_templates(packages, warm_func=None, freeze=True):
+    """Imports every module in the given packages.  Intended to be called in
+    the master process of a pre-forking server (gunicorn, uwsgi, ...) right
+    before the workers are forked.
+
+    :param packages: Iterable of python packages containing compiled templates.
+    :param warm_func: Function called with each template class, to warm up
+        any class-level state the workers would otherwise compute themselves.
+    :param bool freeze: Whether to `gc.freeze()` (python 3.7+) after
+        importing so the garbage collector of the workers leaves the shared
+        objects (and therefore their memory pages) alone.
+    :rtype: PreloadReport
+    """
+    max_rss_before = _max_rss_kb()
+    start = timeit.default_timer()
+
+    modules = templates = 0
+    for package in packages:
+        for module in discover_modules(package):
+            modules += 1
+            if is_template_module(module):
+                templates += 1
+                if warm_func is not None:
+                    warm_func(getattr(module, CLASS_NAME))
+
+    if freeze and hasattr(gc, 'freeze'):
+        gc.freeze()
+        frozen_objects = gc.get_freeze_count()
+    else:
+        frozen_objects = 0
+
+    return PreloadReport(
+        modules=modules,
+        templates=templates,
+        seconds=timeit.default_timer() - start,
+        max_rss_kb=_max_rss_kb() - max_rss_before,
+        frozen_objects=frozen_objects,
+    )
@@ -3,9 +3,10 @@ from __future__ import unicode_literals
 
 import collections
 import inspect
-import pkgutil
 import unittest
 
+from Cheetah.preload import discover_modules
+from Cheetah.preload import trivial
 from Cheetah.testing.partial_template_test_case import PartialTemplateTestCase
 
 
@@ -14,26 +15,6 @@ FILTERED_METHODS = (
 )
 
 
-def trivial(_):
-    return True
-
-
-def discover_modules(package, module_match_func=trivial):
-    """Yields modules matching module_match_func
-
-    :param package: A python package (something with __init__.py)
-    :param module_match_func: Function taking a module and returning True if
-        the module is to be included in the output.
-    """
-    for _, module_name, _ in pkgutil.walk_packages(
-            package.__path__,
-            prefix=package.__name__ + '.',
-    ):
-        module = __import__(module_name, fromlist=[str('__trash')], level=0)
-        if module_match_func(module):
-            yield module
-
-
 def discover_classes(
         package,
         cls_match_func=trivial,
@@ -1,4 +1,5 @@
 #include <Python.h>
+#include <structmember.h>
 
 #if PY_MAJOR_VERSION >= 3
 #define IF_PY3(three, two) (three)
@@ -9,6 +10,68 @@
 static PyObject* NotFound;
 static PyObject* _builtins_module;
 
+/* Number of threads tracking reads (see Cheetah.NameMapper.tracking_reads)
+ * their `(self_names, namespace_names)` sets are in the thread state dict.
+ */
+static Py_ssize_t tracking_threads = 0;
+static PyObject* tracked_reads_key;
+
+/* dict.__getitem__, to detect the dict subclasses overriding it */
+static PyObject* getitem_str;
+static PyObject* dict_getitem;
+
+static PyObject* set_tracked_reads(PyObject* _, PyObject* reads) {
+    PyObject* dict = PyThreadState_GetDict();
+    PyObject* prev;
+
+    if (!dict) {
+        PyErr_SetString(PyExc_RuntimeError, "no thread state dict");
+        return NULL;
+    }
+    if (reads != Py_None && !(PyTuple_Check(reads) && PyTuple_GET_SIZE(reads) == 2)) {
+        PyErr_SetString(PyExc_TypeError, "expected None or a pair of sets");
+        return NULL;
+    }
+
+    if ((prev = PyDict_GetItem(dict, tracked_reads_key))) {
+        Py_INCREF(prev);
+        tracking_threads -= 1;
+    } else {
+        Py_INCREF(Py_None);
+        prev = Py_None;
+    }
+
+    if (reads == Py_None) {
+        if (prev != Py_None && PyDict_DelItem(dict, tracked_reads_key) < 0) {
+            Py_DECREF(prev);
+            return NULL;
+        }
+    } else {
+        if (PyDict_SetItem(dict, tracked_reads_key, reads) < 0) {
+            Py_DECREF(prev);
+            return NULL;
+        }
+        tracking_threads += 1;
+    }
+    return prev;
+}
+
+static int _track_read(Py_ssize_t index, char* key) {
+    PyObject* dict = PyThreadState_GetDict();
+    PyObject* reads;
+    PyObject* name;
+    int ret;
+
+    if (!dict || !(reads = PyDict_GetItem(dict, tracked_reads_key))) {
+        return 0;
+    }
+    if (!(name = PyUnicode_FromString(key))) {
+        return -1;
+    }
+    ret = PySet_Add(PyTuple_GET_ITEM(reads, index), name);
+    Py_DECREF(name);
+    return ret;
+}
 
 static PyObject* _vfsl(char* key, PyObject* selfobj, PyObject* ns) {
     PyObject* ret;
@@ -16,12 +79,42 @@ static PyObject* _vfsl(char* key, PyObject* selfobj, PyObject* ns) {
     PyObject* fmted;
 
     if ((ret = PyObject_GetAttrString(selfobj, key))) {
+        if (tracking_threads && _track_read(0, key) < 0) {
+            Py_DECREF(ret);
+            return NULL;
+        }
         return ret;
     }
 
     PyErr_Clear();
 
-    if ((ret = PyMapping_GetItemString(ns, key))) {
+    if (tracking_threads && _track_read(1, key) < 0) {
+        return NULL;
+    }
+
+    /* Fast path for dicts (and subclasses like LazyNamespace which don't
+     * override __getitem__ and thus only differ by __missing__)
+     */
+    if (
+            PyDict_CheckExact(ns) || (
+                PyDict_Check(ns) &&
+                _PyType_Lookup(Py_TYPE(ns), getitem_str) == dict_getitem
+            )
+    ) {
+        if ((ret = PyDict_GetItemString(ns, key))) {
+            Py_INCREF(ret);
+            return ret;
+        }
+        if (!PyDict_CheckExact(ns)) {
+            /* Errors of __missing__ (other than not finding it) propagate */
+            if (
+                    (ret = PyMapping_GetItemString(ns, key)) ||
+                    !PyErr_ExceptionMatches(PyExc_KeyError)
+            ) {
+                return ret;
+            }
+        }
+    } else if ((ret = PyMapping_GetItemString(ns, key))) {
         return ret;
     }
 
@@ -80,16 +173,456 @@ static PyObject* value_from_frame_or_search_list(PyObject* _, PyObject* args) {
     return _vfsl(key, selfobj, ns);
 }
 
+/* Filters (see Cheetah.filters), markupsafe does the escaping of the
+ * values which aren't text, None, ints or Markup.
+ */
+static PyTypeObject* markup_type;
+static PyObject* markup_escape;
+static PyObject* empty_text;
+static PyObject* empty_markup;
+
+static PyObject* unicode_filter(PyObject* _, PyObject* val) {
+    if (val == Py_None) {
+        Py_INCREF(empty_text);
+        return empty_text;
+    } else if (PyUnicode_Check(val)) {
+        Py_INCREF(val);
+        return val;
+    } else if (PyBytes_Check(val)) {
+        return PyUnicode_DecodeUTF8(PyBytes_AS_STRING(val), PyBytes_GET_SIZE(val), "strict");
+    } else {
+        return IF_PY3(PyObject_Str, PyObject_Unicode)(val);
+    }
+}
+
+/* Same escaping as markupsafe.escape */
+static Py_ssize_t _escaped_length(Py_UCS4 c) {
+    switch (c) {
+        case '"': case '\'': case '&': return 5;
+        case '<': case '>': return 4;
+        default: return 1;
+    }
+}
+
+static const char* _escaped(Py_UCS4 c) {
+    switch (c) {
+        case '"': return "&#34;";
+        case '\'': return "&#39;";
+        case '&': return "&amp;";
+        case '<': return "&lt;";
+        case '>': return "&gt;";
+        default: return NULL;
+    }
+}
+
+#if PY_MAJOR_VERSION >= 3
+#define TEXT_LENGTH(text) PyUnicode_GET_LENGTH(text)
+#define TEXT_READ(text, i) PyUnicode_READ(kind, data, i)
+#define TEXT_WRITE(out, i, c) PyUnicode_WRITE(out_kind, out_data, i, c)
+#else
+#define TEXT_LENGTH(text) PyUnicode_GET_SIZE(text)
+#define TEXT_READ(text, i) (PyUnicode_AS_UNICODE(text)[i])
+#define TEXT_WRITE(out, i, c) (PyUnicode_AS_UNICODE(out)[i] = (c))
+#endif
+
+static PyObject* _escape_text(PyObject* text) {
+    Py_ssize_t length, out_length, i, j;
+    const char* escaped;
+    PyObject* out;
+#if PY_MAJOR_VERSION >= 3
+    int kind, out_kind;
+    void* data;
+    void* out_data;
+
+    if (PyUnicode_READY(text) < 0) {
+        return NULL;
+    }
+    kind = PyUnicode_KIND(text);
+    data = PyUnicode_DATA(text);
+#endif
+
+    length = TEXT_LENGTH(text);
+    out_length = 0;
+    for (i = 0; i < length; i += 1) {
+        out_length += _escaped_length(TEXT_READ(text, i));
+    }
+    if (out_length == length) {
+        Py_INCREF(text);
+        return text;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    if (!(out = PyUnicode_New(out_length, PyUnicode_MAX_CHAR_VALUE(text)))) {
+        return NULL;
+    }
+    out_kind = PyUnicode_KIND(out);
+    out_data = PyUnicode_DATA(out);
+#else
+    if (!(out = PyUnicode_FromUnicode(NULL, out_length))) {
+        return NULL;
+    }
+#endif
+    for (i = 0, j = 0; i < length; i += 1) {
+        Py_UCS4 c = TEXT_READ(text, i);
+        if ((escaped = _escaped(c))) {
+            for (; *escaped; escaped += 1, j += 1) {
+                TEXT_WRITE(out, j, *escaped);
+            }
+        } else {
+            TEXT_WRITE(out, j, c);
+            j += 1;
+        }
+    }
+    return out;
+}
+
+/* Markup(text) for text without __html__ */
+static PyObject* _markup(PyObject* text) {
+    PyObject* args;
+    PyObject* ret;
+
+    if (!text || !(args = PyTuple_Pack(1, text))) {
+        Py_XDECREF(text);
+        return NULL;
+    }
+    ret = PyUnicode_Type.tp_new(markup_type, args, NULL);
+    Py_DECREF(args);
+    Py_DECREF(text);
+    return ret;
+}
+
+static PyObject* markup_filter(PyObject* _, PyObject* val) {
+    PyObject* text;
+    PyObject* ret;
+
+    if (val == Py_None) {
+        Py_INCREF(empty_markup);
+        return empty_markup;
+    } else if (Py_TYPE(val) == markup_type) {
+        Py_INCREF(val);
+        return val;
+    } else if (PyUnicode_CheckExact(val)) {
+        return _markup(_escape_text(val));
+    } else if (IF_PY3(PyLong_CheckExact(val), PyInt_CheckExact(val) || PyLong_CheckExact(val))) {
+        /* Nothing to escape in an int */
+        return _markup(IF_PY3(PyObject_Str, PyObject_Unicode)(val));
+    }
+
+    if (!(text = unicode_filter(NULL, val))) {
+        return NULL;
+    }
+    ret = PyObject_CallFunctionObjArgs(markup_escape, text, NULL);
+    Py_DECREF(text);
+    return ret;
+}
+
+/* A partial template function, see Cheetah.partial_template.default_self */
+typedef struct {
+    PyObject_HEAD
+    PyObject* func;
+    PyObject* template_cls;
+    PyObject* raise_not_called_from_template;
+    PyObject* dict;
+    Py_ssize_t calls;
+} DefaultSelf;
+
+static PyObject* DefaultSelf_new(PyTypeObject* type, PyObject* args, PyObject* kwargs) {
+    PyObject* func;
+    PyObject* template_cls;
+    PyObject* raise_not_called_from_template;
+    DefaultSelf* self;
+
+    if (!PyArg_ParseTuple(args, "OOO", &func, &template_cls, &raise_not_called_from_template)) {
+        return NULL;
+    }
+
+    if (!(self = (DefaultSelf*)type->tp_alloc(type, 0))) {
+        return NULL;
+    }
+    Py_INCREF(func);
+    self->func = func;
+    Py_INCREF(template_cls);
+    self->template_cls = template_cls;
+    Py_INCREF(raise_not_called_from_template);
+    self->raise_not_called_from_template = raise_not_called_from_template;
+    return (PyObject*)self;
+}
+
+static int DefaultSelf_traverse(DefaultSelf* self, visitproc visit, void* arg) {
+    Py_VISIT(self->func);
+    Py_VISIT(self->template_cls);
+    Py_VISIT(self->raise_not_called_from_template);
+    Py_VISIT(self->dict);
+    return 0;
+}
+
+static int DefaultSelf_clear(DefaultSelf* self) {
+    Py_CLEAR(self->func);
+    Py_CLEAR(self->template_cls);
+    Py_CLEAR(self->raise_not_called_from_template);
+    Py_CLEAR(self->dict);
+    return 0;
+}
+
+static void DefaultSelf_dealloc(DefaultSelf* self) {
+    PyObject_GC_UnTrack(self);
+    DefaultSelf_clear(self);
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+/* (first,) + args[start:] */
+static PyObject* _prepend(PyObject* first, PyObject* args, Py_ssize_t start) {
+    Py_ssize_t i;
+    Py_ssize_t size = PyTuple_GET_SIZE(args);
+    PyObject* ret = PyTuple_New(size - start + 1);
+
+    if (!ret) {
+        return NULL;
+    }
+    Py_INCREF(first);
+    PyTuple_SET_ITEM(ret, 0, first);
+    for (i = start; i < size; i += 1) {
+        Py_INCREF(PyTuple_GET_ITEM(args, i));
+        PyTuple_SET_ITEM(ret, i - start + 1, PyTuple_GET_ITEM(args, i));
+    }
+    return ret;
+}
+
+/* Whether `obj` is the template class of the function (which is discarded
+ * like a missing self).  Returns -1 on error.
+ */
+static int _is_own_template_class(DefaultSelf* self, PyObject* obj) {
+    int ret;
+    PyObject* name;
+    PyObject* func_name;
+
+    if (!PyType_Check(obj)) {
+        return 0;
+    }
+    if ((ret = PyObject_IsSubclass(obj, self->template_cls)) != 1) {
+        return ret;
+    }
+    if (!(name = PyObject_GetAttrString(obj, "__name__"))) {
+        return -1;
+    }
+    if (!(func_name = PyObject_GetAttrString(self->func, "__name__"))) {
+        Py_DECREF(name);
+        return -1;
+    }
+    ret = PyObject_RichCompareBool(name, func_name, Py_EQ);
+    Py_DECREF(name);
+    Py_DECREF(func_name);
+    return ret;
+}
+
+static PyObject* _not_called_from_template(DefaultSelf* self) {
+    PyObject* ret = PyObject_CallObject(self->raise_not_called_from_template, NULL);
+    Py_XDECREF(ret);
+    return NULL;
+}
+
+static PyObject* DefaultSelf_call(DefaultSelf* self, PyObject* args, PyObject* kwargs) {
+    PyObject* selfarg = NULL;
+    PyObject* call_args = NULL;
+    PyObject* call_kwargs = NULL;
+    PyObject* template = NULL;
+    PyObject* locals;
+    PyObject* ret = NULL;
+    Py_ssize_t nargs = PyTuple_GET_SIZE(args);
+    int positional_self = nargs > 0;
+    int is_template;
+
+    if (PyThreadState_GET()->c_profilefunc) {
+        self->calls += 1;
+    }
+
+    if (positional_self) {
+        selfarg = PyTuple_GET_ITEM(args, 0);
+    } else if (kwargs && (selfarg = PyDict_GetItemString(kwargs, "self"))) {
+        if (!(call_kwargs = PyDict_Copy(kwargs))) {
+            return NULL;
+        }
+        if (PyDict_DelItemString(call_kwargs, "self") < 0) {
+            goto done;
+        }
+    }
+    if (!call_kwargs) {
+        Py_XINCREF(kwargs);
+        call_kwargs = kwargs;
+    }
+
+    if (selfarg && (is_template = PyObject_IsInstance(selfarg, self->template_cls))) {
+        if (is_template < 0) {
+            goto done;
+        }
+        Py_INCREF(selfarg);
+        template = selfarg;
+        if (positional_self) {
+            Py_INCREF(args);
+            call_args = args;
+        } else if (!(call_args = _prepend(template, args, 0))) {
+            goto done;
+        }
+    } else {
+        int own_template_class = 1;
+
+        if (selfarg && (own_template_class = _is_own_template_class(self, selfarg)) < 0) {
+            goto done;
+        }
+
+        if (!(locals = PyEval_GetLocals())) {
+            PyErr_Clear();
+            _not_called_from_template(self);
+            goto done;
+        }
+        if (!(template = PyMapping_GetItemString(locals, "self"))) {
+            if (PyErr_ExceptionMatches(PyExc_KeyError)) {
+                PyErr_Clear();
+                _not_called_from_template(self);
+            }
+            goto done;
+        }
+
+        if (own_template_class) {
+            call_args = _prepend(template, args, positional_self);
+        } else if (positional_self) {
+            call_args = _prepend(template, args, 0);
+        } else {
+            PyObject* rest = PyTuple_Pack(1, selfarg);
+            call_args = rest ? _prepend(template, rest, 0) : NULL;
+            Py_XDECREF(rest);
+        }
+        if (!call_args) {
+            goto done;
+        }
+    }
+
+    ret = PyObject_Call(self->func, call_args, call_kwargs);
+
+    /* An exception is most likely caused by `self` not being a template */
+    if (!ret && PyErr_ExceptionMatches(PyExc_Exception)) {
+        is_template = PyObject_IsInstance(template, self->template_cls);
+        if (is_template == 0) {
+            PyErr_Clear();
+            _not_called_from_template(self);
+        }
+    }
+
+done:
+    Py_XDECREF(template);
+    Py_XDECREF(call_args);
+    Py_XDECREF(call_kwargs);
+    return ret;
+}
+
+static PyObject* DefaultSelf_get_dict(DefaultSelf* self, void* _) {
+    if (!self->dict && !(self->dict = PyDict_New())) {
+        return NULL;
+    }
+    Py_INCREF(self->dict);
+    return self->dict;
+}
+
+static PyGetSetDef DefaultSelf_getset[] = {
+    {"__dict__", (getter)DefaultSelf_get_dict, NULL, NULL, NULL},
+    {NULL}
+};
+
+static PyMemberDef DefaultSelf_members[] = {
+    {"calls", T_PYSSIZET, offsetof(DefaultSelf, calls), READONLY, NULL},
+    {NULL}
+};
+
+static PyTypeObject DefaultSelfType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_cheetah.DefaultSelf",                     /* tp_name */
+    sizeof(DefaultSelf),                        /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)DefaultSelf_dealloc,            /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare / tp_as_async */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    (ternaryfunc)DefaultSelf_call,              /* tp_call */
+    0,                                          /* tp_str */
+    PyObject_GenericGetAttr,                    /* tp_getattro */
+    PyObject_GenericSetAttr,                    /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    0,                                          /* tp_doc */
+    (traverseproc)DefaultSelf_traverse,         /* tp_traverse */
+    (inquiry)DefaultSelf_clear,                 /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    0,                                          /* tp_methods */
+    DefaultSelf_members,                        /* tp_members */
+    DefaultSelf_getset,                         /* tp_getset */
+    0,                                          /* tp_base */
+    0,                                          /* tp_dict */
+    0,                                          /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    offsetof(DefaultSelf, dict),                /* tp_dictoffset */
+    0,                                          /* tp_init */
+    0,                                          /* tp_alloc */
+    DefaultSelf_new,                            /* tp_new */
+};
+
+static int _setup_filters(void) {
+    PyObject* markupsafe = PyImport_ImportModule("markupsafe");
+
+    if (!markupsafe) {
+        return -1;
+    }
+    markup_type = (PyTypeObject*)PyObject_GetAttrString(markupsafe, "Markup");
+    Py_DECREF(markupsafe);
+    if (!markup_type) {
+        return -1;
+    }
+    if (!PyType_Check((PyObject*)markup_type) || !PyType_IsSubtype(markup_type, &PyUnicode_Type)) {
+        PyErr_SetString(PyExc_TypeError, "expected markupsafe.Markup to be a text type");
+        return -1;
+    }
+    if (
+            !(markup_escape = PyObject_GetAttrString((PyObject*)markup_type, "escape")) ||
+            !(empty_text = PyUnicode_FromString("")) ||
+            !(empty_markup = _markup(unicode_filter(NULL, Py_None)))
+    ) {
+        return -1;
+    }
+    return 0;
+}
+
 static PyObject* _setup_module(PyObject* module) {
     if (module) {
         NotFound = PyErr_NewException("_cheetah.NotFound", PyExc_LookupError, NULL);
         PyModule_AddObject(module, "NotFound", NotFound);
 
         _builtins_module = PyImport_ImportModule(IF_PY3("builtins", "__builtin__"));
-        if (!_builtins_module) {
+        tracked_reads_key = PyUnicode_FromString("_cheetah.tracked_reads");
+#if PY_MAJOR_VERSION >= 3
+        getitem_str = PyUnicode_InternFromString("__getitem__");
+#else
+        getitem_str = PyString_InternFromString("__getitem__");
+#endif
+        if (getitem_str) {
+            dict_getitem = _PyType_Lookup(&PyDict_Type, getitem_str);
+        }
+        if (
+                !_builtins_module || !tracked_reads_key || !dict_getitem ||
+                _setup_filters() < 0 || PyType_Ready(&DefaultSelfType) < 0
+        ) {
             Py_DECREF(module);
-            module = NULL;
+            return NULL;
         }
+        Py_INCREF(&DefaultSelfType);
+        PyModule_AddObject(module, "DefaultSelf", (PyObject*)&DefaultSelfType);
     }
     return module;
 }
@@ -105,6 +638,21 @@ static struct PyMethodDef methods[] = {
         (PyCFunction)value_from_frame_or_search_list,
         METH_VARARGS
     },
+    {
+        "set_tracked_reads",
+        (PyCFunction)set_tracked_reads,
+        METH_O
+    },
+    {
+        "unicode_filter",
+        (PyCFunction)unicode_filter,
+        METH_O
+    },
+    {
+        "markup_filter",
+        (PyCFunction)markup_filter,
+        METH_O
+    },
     {NULL, NULL}
 };
 
@@ -0,0 +1,10 @@
+from Cheetah import legacy_compiler
+from Cheetah.compile import compile_source
+
+from constants import STATIC_SRC
+
+
+def run():
+    # Parse the source again rather than compile its memoized tree
+    legacy_compiler._parse_cache.clear()
+    compile_source(STATIC_SRC)
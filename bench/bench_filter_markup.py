@@ -0,0 +1,11 @@
+from Cheetah.filters import markup_filter
+
+from constants import ITERATIONS
+
+
+VALUES = ('plain text', '<a href="#">Tom & Jerry</a>', 42, None) * ITERATIONS
+
+
+def run():
+    for value in VALUES:
+        markup_filter(value)
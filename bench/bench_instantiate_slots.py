@@ -0,0 +1,12 @@
+from Cheetah.compile import compile_to_class
+
+from constants import ITERATIONS
+from constants import NAMESPACE
+
+
+cls = compile_to_class('$foo', settings={'useSlots': True})
+
+
+def run():
+    for _ in range(ITERATIONS * 10):
+        cls(NAMESPACE)
@@ -0,0 +1,7 @@
+from Cheetah.compile import compile_to_class
+
+from constants import PARTIAL_CALL_SRC
+
+
+tmpl = compile_to_class(PARTIAL_CALL_SRC)()
+run = tmpl.respond
@@ -0,0 +1,13 @@
+from Cheetah.compile import compile_to_class
+from Cheetah.Template import render_many
+
+from constants import ITERATIONS
+from constants import NAMESPACE
+
+
+cls = compile_to_class('$foo')
+
+
+def run():
+    for _ in render_many(cls, [NAMESPACE] * (ITERATIONS * 10)):
+        pass
@@ -0,0 +1,111 @@
+"""Compile time benchmark over synthetic templates of growing size.
+
+Prints one line of json per template size with the time spent parsing
+(`LegacyCompiler.parse`) and generating code (`getModuleCode`) and the
+throughput of each in lines and bytes per second.  The throughput should
+stay roughly constant as the size grows; a drop shows quadratic behaviour.
+
+    python bench/compile_scaling.py [--sizes 10,100,1000] [--repeat 3]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import timeit
+
+from Cheetah import legacy_compiler
+from Cheetah.legacy_compiler import LegacyCompiler
+
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 100000)
+
+# Chunks of template, in the proportions they are used
+TEXT = (
+    '<div class="row">\n'
+    '    <p>Some static text which takes up a line.</p>\n'
+    '</div>\n'
+)
+PLACEHOLDERS = (
+    '<a href="$url">$title</a> ${user.name} $format_date($created)\n'
+)
+DIRECTIVES = (
+    '#for item in $items\n'
+    '    #if item.visible\n'
+    '        <li>$item.name</li>\n'
+    '    #else\n'
+    '        <li class="hidden">${item.name.upper()}</li>\n'
+    '    #end if\n'
+    '#end for\n'
+)
+
+
+def _def(i):
+    return (
+        '#def helper_{0}(x, y=None)\n'
+        '    <span>$x</span>\n'
+        '    #if y is not None: $y\n'
+        '#end def\n'.format(i)
+    )
+
+
+def generate_template(lines):
+    """Generates a template of roughly `lines` lines."""
+    chunks = []
+    total = i = 0
+    while total < lines:
+        for chunk in (TEXT, PLACEHOLDERS, DIRECTIVES, TEXT, _def(i)):
+            chunks.append(chunk)
+            total += chunk.count('\n')
+        i += 1
+    return ''.join(chunks)
+
+
+def bench_size(lines, repeat):
+    src = generate_template(lines)
+    best_parse = best_codegen = float('inf')
+    for _ in range(repeat):
+        # Parse the source again rather than compile its memoized tree
+        legacy_compiler._parse_cache.clear()
+        compiler = LegacyCompiler(src)
+        start = timeit.default_timer()
+        compiler.parse()
+        parsed = timeit.default_timer()
+        compiler.getModuleCode()
+        end = timeit.default_timer()
+        best_parse = min(best_parse, parsed - start)
+        best_codegen = min(best_codegen, end - parsed)
+
+    src_lines = src.count('\n')
+    src_bytes = len(src.encode('UTF-8'))
+    return {
+        'lines': src_lines,
+        'bytes': src_bytes,
+        'parse_seconds': best_parse,
+        'codegen_seconds': best_codegen,
+        'parse_lines_per_second': src_lines / best_parse,
+        'parse_bytes_per_second': src_bytes / best_parse,
+        'codegen_lines_per_second': src_lines / best_codegen,
+        'codegen_bytes_per_second': src_bytes / best_codegen,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--sizes',
+        default=','.join(str(size) for size in DEFAULT_SIZES),
+        help='Comma separated numbers of lines of the generated templates.',
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='Compile each template this many times, keeping the best time.',
+    )
+    args = parser.parse_args(argv)
+
+    for size in args.sizes.split(','):
+        print(json.dumps(bench_size(int(size), args.repeat), sort_keys=True))
+
+
+if __name__ == '__main__':
+    exit(main())
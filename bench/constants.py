@@ -3,6 +3,9 @@ from __future__ import unicode_literals
 
 ITERATIONS = 10
 
+NAMESPACE = dict(('key_{0}'.format(i), i) for i in range(100))
+NAMESPACE['foo'] = 'bar'
+
 LOCAL_SRC = (
     '#from constants import ITERATIONS\n'
     '#def foo(x)\n'
@@ -32,3 +35,45 @@ DOTTED_SL_SRC = (
     '#from constants import ITERATIONS\n'
     '#py [$foo.bar[0].upper() for _ in range(ITERATIONS)]\n'
 )
+
+LONG_SRC = ''.join(
+    '<tr><td>$row_{0}</td>\n'
+    '#if $show\n'
+    '<td>${{self.cell({0})}}</td>\n'
+    '#end if\n'
+    '</tr>\n'.format(i)
+    for i in range(1000)
+)
+
+STATIC_SRC = (
+    '<div class="static">Lorem ipsum dolor sit amet, consectetur.</div>\n' *
+    2000
+) + '$foo\n'
+
+DIRECTIVES_SRC = ''.join(
+    '#for item in items\n'
+    '#py total = item.price * item.count\n'
+    '#try\n'
+    '$total\n'
+    '#except ValueError as e\n'
+    '$e\n'
+    '#end try\n'
+    '#end for\n'
+    '#from os.path import join\n'
+    for _ in range(300)
+)
+
+PARTIAL_SRC = (
+    '#extends Cheetah.partial_template\n'
+    '#def item(x)\n'
+    '<li>$x</li>\n'
+    '#end def\n'
+)
+
+PARTIAL_CALL_SRC = (
+    '#from constants import ITERATIONS\n'
+    '#from partial_items import item\n'
+    '#for i in range(ITERATIONS * 10)\n'
+    '$item($i)\n'
+    '#end for\n'
+)
@@ -0,0 +1,7 @@
+"""The partial template called by the bench_partial_call_* benchmarks."""
+from Cheetah.compile import compile_source
+
+from constants import PARTIAL_SRC
+
+
+exec(compile_source(PARTIAL_SRC))  # pylint:disable=exec-used
@@ -3,11 +3,20 @@ from __future__ import unicode_literals
 
 import io
 import os.path
+import pickle
+import sys
+import types
 
+import pytest
+
+from Cheetah import legacy_compiler
 from Cheetah.cheetah_compile import compile_template
 from Cheetah.compile import _create_module_from_source
 from Cheetah.compile import compile_source
 from Cheetah.compile import compile_to_class
+from Cheetah.legacy_compiler import LegacyCompiler
+from Cheetah.legacy_parser import ParseError
+from Cheetah.Template import Template
 from testing.util import run_python
 
 
@@ -221,3 +230,167 @@ def test_optimization_kwargs():
         '#end def\n'
     )
     assert ' _v = kwargs #' in src
+
+
+def test_parsed_template_is_picklable():
+    compiler = LegacyCompiler(
+        '#def foo(x=1)\n$x ${x.upper()}\n#end def\n#py a = $b\n$a\n',
+    )
+    parsed_template = compiler.parse()
+    assert pickle.loads(pickle.dumps(parsed_template, 2)) == parsed_template
+    # Parsing again reuses the tree
+    assert compiler.parse() is parsed_template
+
+
+def test_parse_cached_by_source():
+    src = '#py x = 1\n$x $foo\n'
+    compiler = LegacyCompiler(src)
+    parsed_template = compiler.parse()
+    other = LegacyCompiler(src, settings={'useNameMapper': False})
+    assert other.parse() is parsed_template
+    # The source wasn't parsed again, yet the counts are known
+    assert other._parser.placeholder_count == 0
+    counts = other.get_counts()
+    assert (counts['placeholders'], counts['directives']) == (2, 1)
+    # The code generation still depends on the settings
+    assert 'VFFSL' in compiler.getModuleCode().split('def respond')[1]
+    assert 'VFFSL' not in other.getModuleCode().split('def respond')[1]
+    assert LegacyCompiler(src + ' ').parse() is not parsed_template
+
+
+def test_parse_cache_bounded(monkeypatch):
+    monkeypatch.setattr(legacy_compiler, '_parse_cache', {})
+    monkeypatch.setattr(legacy_compiler, '_MAXCACHE', 2)
+    for src in ('a', 'b', 'c'):
+        LegacyCompiler(src).parse()
+    assert len(legacy_compiler._parse_cache) == 1
+
+
+def _compiled_while_parsing(src):
+    compiler = LegacyCompiler(src)
+    compiler._compile_while_parsing()
+    return compiler
+
+
+def test_compile_parsed_template():
+    src = (
+        '#import os\n'
+        '#def f(a, b=1)\n  #for $a in $b: $a $os.sep\n#end def\n'
+        '#for x in y\n#if $x: #end for\n$_("hi") ## comment\n'
+        '#compiler-settings\nuseNameMapper = False\n#end compiler-settings\n'
+        '#block b: $z\n'
+    )
+    # The tree of the source is compiled to the same code as the source
+    # compiled while it is parsed (to find its first error)
+    compiler = _compiled_while_parsing(src)
+    other = LegacyCompiler(src)
+    assert other.getModuleCode() == compiler.getModuleCode()
+    assert other.get_counts() == compiler.get_counts()
+    assert other.parse() == compiler.parse()
+
+
+def test_compile_parsed_template_trailing_var():
+    # The $var is found after the last node
+    src = 'a #implements foo $x'
+    counts = _compiled_while_parsing(src).get_counts()
+    compiler = LegacyCompiler(src)
+    compiler.getModuleCode()
+    assert compiler.get_counts() == counts
+    assert counts['vffsl_sites'] == 1
+
+
+def test_compile_parsed_template_python_expression(monkeypatch):
+    monkeypatch.setattr(legacy_compiler, '_parse_cache', {})
+    src = '#attr foo = $bar\n'
+    assert LegacyCompiler(src, settings={'useNameMapper': False}).getModuleCode()
+    with pytest.raises(ParseError) as excinfo:
+        LegacyCompiler(src).getModuleCode()
+    assert str(excinfo.value).startswith(
+        '\n\n'
+        'Invalid #attr directive. It should contain simple Python literals.\n'
+        'Line 1, column 13\n'
+    )
+
+
+def test_compile_parsed_template_error(monkeypatch):
+    monkeypatch.setattr(legacy_compiler, '_parse_cache', {})
+
+    class NoExtendsCompiler(LegacyCompiler):
+        def set_extends(self, extends_name):
+            raise AssertionError('no #extends')
+
+    src = '$x\n#extends foo\n'
+    assert LegacyCompiler(src).getModuleCode()
+    with pytest.raises(ParseError) as excinfo:
+        NoExtendsCompiler(src).getModuleCode()
+    # Reported where the parser made the node
+    assert str(excinfo.value).startswith(
+        '\n\nAssertionError: no #extends\n\nLine 2, column 13\n'
+    )
+
+
+def test_first_compile_parses_statements_in_a_batch(monkeypatch):
+    monkeypatch.setattr(legacy_compiler, '_parse_cache', {})
+    batches = []
+    monkeypatch.setattr(
+        legacy_compiler, 'parse_batch',
+        lambda statements: batches.append(list(statements)),
+    )
+    LegacyCompiler('#import os\n#py x = $y\n#py z = 1\n').getModuleCode()
+    # The statements containing $vars aren't known yet
+    assert batches == [['import os', 'z = 1']]
+
+
+def test_get_module_code_twice():
+    compiler = LegacyCompiler('#import os\n$os.sep $foo\n')
+    assert compiler.getModuleCode() == compiler.getModuleCode()
+    assert compiler.getModuleCode().count('import os') == 1
+
+
+def test_marker_char_in_source():
+    # The character the parser would otherwise use to mark $vars
+    cls = compile_to_class('\ue000$x\ue000 ${"\ue0000\ue000"}\n')
+    assert cls({'x': 1}).respond() == '\ue0001\ue000 \ue0000\ue000\n'
+
+
+def test_namespace_names():
+    cls = compile_to_class(
+        '#import os\n'
+        '#attr x = 1\n'
+        '#def helper(arg)\n$arg $inner\n#end def\n'
+        '$foo.bar $os.sep $len($x) $helper(1) $self.helper(2) $getVar("dyn")\n'
+        '#for i in $items\n$i\n#end for\n'
+    )
+    module = cls.__module_obj__
+    assert module.__CHEETAH_namespace_names__ == frozenset(
+        ('foo', 'inner', 'items'),
+    )
+    assert cls.__CHEETAH_namespace_names__ is module.__CHEETAH_namespace_names__
+    assert Template.__CHEETAH_namespace_names__ == frozenset()
+
+
+def test_namespace_names_of_bases():
+    base = types.ModuleType(str('namespace_names_base'))
+    sys.modules[base.__name__] = base
+    try:
+        exec(compile_source(
+            '$title\n#attr count = 1\n$count $brand\n',
+        ), base.__dict__)
+        compiler = LegacyCompiler(
+            '#extends namespace_names_base\n'
+            '#attr brand = "x"\n'
+            '#def title()\n$name\n#end def\n'
+            '$heading $brand\n',
+        )
+        child = _create_module_from_source(compiler.getModuleCode())
+    finally:
+        del sys.modules[base.__name__]
+
+    assert base.__CHEETAH_namespace_names__ == frozenset(('title', 'brand'))
+    # Names resolved by the methods / attributes of the child are not
+    # looked up in the namespace
+    assert child.__CHEETAH_namespace_names__ == frozenset(('name', 'heading'))
+    assert compiler.get_namespace_names() == {
+        'namespace_names': ['heading', 'name'],
+        'extends': 'namespace_names_base',
+    }
@@ -1,12 +1,17 @@
 from __future__ import unicode_literals
 
+import threading
+
+import _cheetah
 import mock
 import pytest
 
 from Cheetah.compile import compile_to_class
+from Cheetah.NameMapper import LazyNamespace
 from Cheetah.NameMapper import NotFound
 from Cheetah.NameMapper import py_value_from_frame_or_search_list
 from Cheetah.NameMapper import py_value_from_search_list
+from Cheetah.NameMapper import tracking_reads
 from Cheetah.NameMapper import value_from_frame_or_search_list
 from Cheetah.NameMapper import value_from_search_list
 
@@ -97,3 +102,149 @@ def test_map_builtins_int():
         ''',
     )
     assert 5 == template_cls().intify('5')
+
+
+@vfsl_tests
+def test_VFSL_tracking_reads(vfsl):
+    class C(object):
+        attr = 1
+
+    with tracking_reads() as reads:
+        assert vfsl('attr', C, {'a': 2}) == 1
+        assert vfsl('a', C, {'a': 2}) == 2
+        with pytest.raises(NotFound):
+            vfsl('missing', C, {})
+    assert reads.self_names == set(['attr'])
+    assert reads.namespace_names == set(['a', 'missing'])
+
+    # No longer tracking
+    vfsl('b', C, {'b': 1})
+    assert reads.namespace_names == set(['a', 'missing'])
+
+
+@vffsl_tests
+def test_VFFSL_tracking_reads(vffsl):
+    with tracking_reads() as reads:
+        assert vffsl('x', {'x': 1}, {}, object(), {'x': 2}) == 1
+        assert vffsl('y', {}, {}, object(), {'y': 2}) == 2
+    assert reads.self_names == set()
+    assert reads.namespace_names == set(['y'])
+
+
+@vfsl_tests
+def test_tracking_reads_nested(vfsl):
+    with tracking_reads() as outer:
+        vfsl('a', object(), {'a': 1})
+        with tracking_reads() as inner:
+            vfsl('b', object(), {'b': 1})
+        vfsl('c', object(), {'c': 1})
+    assert inner.namespace_names == set(['b'])
+    assert outer.namespace_names == set(['a', 'b', 'c'])
+
+
+@vfsl_tests
+def test_tracking_reads_per_thread(vfsl):
+    def lookup():
+        vfsl('other', object(), {'other': 1})
+
+    with tracking_reads() as reads:
+        thread = threading.Thread(target=lookup)
+        thread.start()
+        thread.join()
+    assert reads.namespace_names == set()
+
+
+def test_set_tracked_reads_type_error():
+    with pytest.raises(TypeError):
+        _cheetah.set_tracked_reads(set())
+
+
+@vfsl_tests
+def test_VFSL_lazy_namespace(vfsl):
+    calls = []
+
+    def get_reviews():
+        calls.append(True)
+        return ['great']
+
+    ns = LazyNamespace({'user': 'buck'}, lazy={'reviews': get_reviews})
+    assert vfsl('user', object(), ns) == 'buck'
+    assert calls == []
+    assert ns.timings == {}
+    assert vfsl('reviews', object(), ns) == ['great']
+    assert vfsl('reviews', object(), ns) == ['great']
+    assert calls == [True]
+    assert list(ns.timings) == ['reviews']
+    assert ns.timings['reviews'] >= 0
+    with pytest.raises(NotFound):
+        vfsl('missing', object(), ns)
+
+
+@vfsl_tests
+def test_VFSL_lazy_namespace_error_retried(vfsl):
+    values = iter((None, 'ok'))
+
+    def get_value():
+        value = next(values)
+        if value is None:
+            raise ValueError('failed')
+        return value
+
+    ns = LazyNamespace(lazy={'value': get_value})
+    with pytest.raises(ValueError):
+        vfsl('value', object(), ns)
+    assert vfsl('value', object(), ns) == 'ok'
+
+
+def test_VFSL_dict_subclass_getitem():
+    # The fast path for dicts is only taken when __getitem__ isn't overridden
+    vfsl = value_from_search_list
+
+    class UpperDict(dict):
+        def __getitem__(self, key):
+            return dict.__getitem__(self, key).upper()
+
+    class DefaultDict(dict):
+        def __missing__(self, key):
+            return 'default'
+
+    assert vfsl('a', object(), UpperDict(a='a')) == 'A'
+    assert vfsl('a', object(), DefaultDict()) == 'default'
+
+
+def test_lazy_namespace_mapping():
+    ns = LazyNamespace((('a', 1),), lazy={'b': lambda: 2})
+    assert len(ns) == 2
+    assert bool(LazyNamespace(lazy={'b': lambda: 2}))
+    assert 'b' in ns
+    assert 'c' not in ns
+    assert ns.get('c') is None
+    assert ns.get('c', 3) == 3
+    assert sorted(ns) == ['a', 'b']
+    assert ns.timings == {}
+    assert sorted(ns.keys()) == ['a', 'b']
+    assert sorted(ns.values()) == [1, 2]
+    assert sorted(ns.items()) == [('a', 1), ('b', 2)]
+    assert ns.get('b') == 2
+    assert list(ns.timings) == ['b']
+    assert len(ns) == 2
+
+
+def test_lazy_namespace_both_computed_and_lazy():
+    with pytest.raises(ValueError) as excinfo:
+        LazyNamespace({'b': 1, 'a': 1}, lazy={'a': int, 'b': int})
+    assert excinfo.value.args == ('Names both computed and lazy: a, b',)
+
+
+def test_lazy_namespace_in_template():
+    cls = compile_to_class(
+        '#if $show\n'
+        '$reviews\n'
+        '#end if\n'
+    )
+    ns = LazyNamespace({'show': False}, lazy={'reviews': lambda: 'great'})
+    assert cls(ns).respond() == ''
+    assert ns.timings == {}
+    ns = LazyNamespace({'show': True}, lazy={'reviews': lambda: 'great'})
+    assert cls(ns).respond() == 'great\n'
+    assert list(ns.timings) == ['reviews']
@@ -3,10 +3,21 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import pytest
+import six
 
 from Cheetah.compile import compile_to_class
+from Cheetah.legacy_parser import _marker_char
 from Cheetah.legacy_parser import ArgList
+from Cheetah.legacy_parser import CheetahVar
+from Cheetah.legacy_parser import Directive
+from Cheetah.legacy_parser import End
+from Cheetah.legacy_parser import iter_nodes
+from Cheetah.legacy_parser import LegacyParser
+from Cheetah.legacy_parser import ParsedTemplate
 from Cheetah.legacy_parser import ParseError
+from Cheetah.legacy_parser import Placeholder
+from Cheetah.legacy_parser import Strip
+from Cheetah.legacy_parser import Text
 from Cheetah.legacy_parser import UnknownDirectiveError
 from testing.util import assert_raises_exactly
 
@@ -579,3 +590,120 @@ def test_errors_on_blinged_kwarg():
         compile_to_class(
             '$foo($bar=$baz)'
         )
+
+
+def test_top_level_tokens_and_plain_text():
+    cls = compile_to_class(
+        '\\$a \\#if $ 5 #1 #@ $()\n'
+        '#if $x\n'
+        '$x${x}$(x + 1)#@#@1 ## comment\n'
+        '#end if\n'
+    )
+    assert cls({'x': 1}).respond() == (
+        '$a #if $ 5 #1 #@ $()\n'
+        '112#@#@1 \n'
+    )
+
+
+def test_parser_assertion_is_parse_error():
+    with assert_raises_exactly(
+        ParseError,
+        '\n\n'
+        'AssertionError: \n\n'
+        'Line 1, column 11\n\n'
+        'Line|Cheetah Code\n'
+        '----|-------------------------------------------------------------\n'
+        '1   |#attr foo 1\n'
+        '               ^\n'
+    ):
+        compile_to_class('#attr foo 1\n')
+
+
+def test_marker_char():
+    assert _marker_char('foo') == '\ue000'
+    assert _marker_char('\ue000\ue001') == '\ue002'
+    with pytest.raises(AssertionError):
+        _marker_char(''.join(six.unichr(c) for c in range(0xE000, 0xF900)))
+
+
+def test_parsed_template():
+    parser = LegacyParser('a\n#if $b: $c.d\n')
+    parser.parse()
+    assert parser.parsed_template() == ParsedTemplate(
+        '\ue000',
+        [
+            CheetahVar(1, [('b', '')], (2, 6), False, None),
+            CheetahVar(2, [('c.d', '')], (2, 9), False, None),
+        ],
+        [
+            Text(2, 'a\n'),
+            Directive(
+                9, 'if', ('if \ue0000\ue000', (2, 1)), True,
+                [
+                    Placeholder(14, '\ue0001\ue000', '$c.d', (2, 9)),
+                    Text(15, '\n'),
+                    End(15, 'if', True),
+                ],
+            ),
+        ],
+    )
+
+
+def test_parsed_template_end_in_single_line_directive():
+    parser = LegacyParser('#for x in y\n#if a: #end for\nb')
+    parser.parse()
+    # The #end for is in the body of the #if, so the nodes are compiled in
+    # source order
+    nodes = parser.parsed_template().nodes
+    assert nodes == [
+        Strip(12),
+        Directive(
+            12, 'for', ('for x in y', (1, 1)), False,
+            [
+                Directive(
+                    18, 'if', ('if a', (2, 1)), True,
+                    [End(27, 'for', False), Text(28, '\n'), End(28, 'if', True)],
+                ),
+            ],
+        ),
+        Text(29, 'b'),
+    ]
+    assert [type(node) for node in iter_nodes(nodes)] == [
+        Strip, Directive, Directive, End, Text, End, Text,
+    ]
+
+
+def test_parsed_template_python_only():
+    parser = LegacyParser('#attr x = [$a for $b in c]\n')
+    parser.parse()
+    assert [
+        cheetah_var.python_only
+        for cheetah_var in parser.parsed_template().cheetah_vars
+    ] == [
+        (10, 'Invalid #attr directive. It should contain simple Python literals.'),
+        (18, 'lvalue of for must not contain a `$`'),
+    ]
+
+
+def test_python_expression_of_plain_vars():
+    cls = compile_to_class(
+        '#import os\n'
+        '#attr sep = $os.sep\n'
+        '#def f(a)\n#for $a in range(2)\n$a\n#end for\n#end def\n'
+        '$sep $f(1)\n'
+    )
+    assert cls().respond() == '/ 0\n1\n\n'
+
+
+def test_python_expression_error_before_later_errors():
+    with assert_raises_exactly(
+        ParseError,
+        '\n\n'
+        'lvalue of for must not contain a `$`\n'
+        'Line 1, column 6\n\n'
+        'Line|Cheetah Code\n'
+        '----|-------------------------------------------------------------\n'
+        '1   |#for $a in range(2\n'
+        '          ^\n'
+    ):
+        compile_to_class('#for $a in range(2\n')
@@ -0,0 +1,94 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import pytest
+
+from Cheetah.SourceReader import SourceReader
+
+
+def test_line_num():
+    reader = SourceReader('ab\ncd\r\n\nef')
+    assert [reader.lineNum(pos) for pos in (0, 1, 2)] == [0, 0, 0]
+    assert [reader.lineNum(pos) for pos in (3, 4, 5)] == [1, 1, 1]
+    assert reader.lineNum(7) == 2
+    assert reader.lineNum(8) == 3
+    assert reader.lineNum(10) == 3
+    # Going back to an earlier line
+    assert reader.lineNum(1) == 0
+
+
+@pytest.mark.parametrize('src', ('ab\ncd\r\n', ''))
+@pytest.mark.parametrize('pos', (-1, 6, 8))
+def test_line_num_unknown_position(src, pos):
+    reader = SourceReader(src)
+    with pytest.raises(AssertionError) as excinfo:
+        reader.lineNum(pos)
+    assert excinfo.value.args == ('unknown position: {0}'.format(pos),)
+
+
+def test_get_row_col():
+    reader = SourceReader('ab\ncd\n')
+    assert reader.getRowCol() == (1, 1)
+    assert reader.getRowCol(4) == (2, 2)
+    reader.setPos(2)
+    assert reader.getRowColLine() == (1, 3, 'ab')
+
+
+@pytest.mark.parametrize(('src', 'BOLs', 'EOLs'), (
+    ('', [], []),
+    ('a', [0], [1]),
+    ('a\n', [0], [1]),
+    ('\n\n', [0, 1], [0, 1]),
+    ('ab\r\ncd\re\n\rf', [0, 4, 7, 9, 10], [2, 6, 8, 9, 11]),
+))
+def test_line_index(src, BOLs, EOLs):
+    reader = SourceReader(src)
+    assert list(reader._BOLs) == BOLs
+    assert list(reader._EOLs) == EOLs
+
+
+def test_find_bol():
+    reader = SourceReader('ab\r\ncd')
+    assert reader.findBOL() == 0
+    assert reader.findBOL(5) == 4
+    reader.setPos(6)
+    assert reader.findBOL() == 4
+
+
+def test_invalid_positions():
+    reader = SourceReader('abc')
+    reader.setBreakPoint(2)
+    with pytest.raises(AssertionError) as excinfo:
+        reader.peek(3)
+    assert excinfo.value.args == (
+        "pos (3) is invalid: beyond the stream's end (1)",
+    )
+    with pytest.raises(AssertionError) as excinfo:
+        reader.advance(-1)
+    assert excinfo.value.args == ('pos (-1) is invalid: less than 0',)
+    with pytest.raises(AssertionError):
+        reader.readTo(3)
+    reader.advance(2)
+    with pytest.raises(AssertionError):
+        reader.getc()
+    assert reader.pos() == 2
+
+
+def test_get_white_space():
+    reader = SourceReader('a \t \tb   ')
+    assert reader.getWhiteSpace() == ''
+    reader.advance()
+    assert reader.getWhiteSpace(maximum=2) == ' \t'
+    assert reader.getWhiteSpace() == ' \t'
+    assert reader.getc() == 'b'
+    reader.setBreakPoint(8)
+    assert reader.getWhiteSpace() == '  '
+    assert reader.getWhiteSpace() == ''
+
+
+def test_startswith():
+    reader = SourceReader('#end if')
+    reader.advance()
+    assert reader.startswith('end')
+    assert not reader.startswith('if')
+    assert reader.startswith('if', 5)
@@ -3,6 +3,9 @@ from __future__ import unicode_literals
 import pytest
 
 from Cheetah.compile import compile_to_class
+from Cheetah.NameMapper import LazyNamespace
+from Cheetah.NameMapper import NotFound
+from Cheetah.Template import render_many
 from Cheetah.Template import Template
 
 
@@ -23,6 +26,39 @@ def test_raises_using_reserved_variable():
     )
 
 
+def test_raises_using_reserved_variables_sorted():
+    cls = compile_to_class('foo')
+    namespace = dict(('k{0}'.format(i), i) for i in range(100))
+    namespace.update(varExists=1, getVar=2)
+
+    with pytest.raises(AssertionError) as excinfo:
+        cls(namespace)
+    assert '  > getVar, varExists \n' in excinfo.value.args[0]
+
+
+def test_raises_using_reserved_variable_lazy():
+    cls = compile_to_class('foo')
+
+    with pytest.raises(AssertionError):
+        cls(LazyNamespace(lazy={'getVar': int}))
+
+
+def test_reserved_check_disabled():
+    class NotChecked(compile_to_class('foo')):
+        __CHEETAH_check_reserved__ = False
+
+    assert NotChecked({'getVar': 'lol'}).respond() == 'foo'
+
+
+def test_instances_slots():
+    cls = compile_to_class('$foo', settings={'useSlots': True})
+    inst = cls({'foo': 'bar'})
+    assert inst.respond() == 'bar'
+    assert not hasattr(inst, '__dict__')
+    assert not hasattr(Template(), '__dict__')
+    assert hasattr(compile_to_class('$foo')(), '__dict__')
+
+
 def test_TryExceptImportTestFailCase():
     """Test situation where an inline #import statement will get relocated"""
     source = '''
@@ -61,3 +97,73 @@ def test_wrong_type_namespace():
     assert excinfo.value.args == (
         "`namespace` must be `Mapping` but got 'bar'",
     )
+
+
+def test_respond_with_reads():
+    cls = compile_to_class(
+        '#def helper()\nhelped\n#end def\n'
+        '$foo $self.helper() $helper()#slurp\n'
+        '#if $show\n$bar\n#end if\n'
+    )
+    output, reads = cls({'foo': 1, 'bar': 2, 'show': False}).respond_with_reads()
+    assert output == '1 helped\n helped\n'
+    assert reads.self_names == set(['helper'])
+    # $bar wasn't displayed
+    assert reads.namespace_names == set(['foo', 'show'])
+
+
+def test_template_defining_reset():
+    cls = compile_to_class(
+        '#def reset()\n'
+        'reset $foo\n'
+        '#end def\n'
+        '$reset()'
+    )
+    assert cls({'foo': 'bar'}).respond() == 'reset bar\n'
+    assert list(render_many(cls, [{'foo': 'baz'}])) == ['reset baz\n']
+
+
+def test_namespace_reset_key():
+    cls = compile_to_class('$reset / $render_many')
+    namespace = {'reset': 'R', 'render_many': 'M'}
+    assert cls(namespace).respond() == 'R / M'
+    assert list(render_many(cls, [namespace])) == ['R / M']
+
+
+def test_namespace_instance_attribute_keys():
+    cls = compile_to_class('$foo')
+    namespace = {'foo': 'bar', 'transaction': 1, '_CHEETAH__namespace': 2}
+    assert cls(namespace).respond() == 'bar'
+
+
+def test_render_many():
+    cls = compile_to_class(
+        '#from Cheetah.filters import unicode_filter\n'
+        '#def unfiltered()\n'
+        '#with self.set_filter(unicode_filter)\n'
+        '$foo#slurp\n'
+        '#end with\n'
+        '#end def\n'
+        '$foo $unfiltered()\n'
+    )
+    outputs = render_many(cls, [{'foo': 1}, {'foo': '<2>'}, {'foo': 3}])
+    assert list(outputs) == ['1 1\n', '&lt;2&gt; <2>\n', '3 3\n']
+
+
+def test_render_many_filter_fn():
+    cls = compile_to_class('$foo')
+    outputs = render_many(cls, [{'foo': '<1>'}], filter_fn=lambda value: value)
+    assert list(outputs) == ['<1>']
+
+
+def test_render_many_error():
+    cls = compile_to_class('$foo')
+    outputs = render_many(cls, [{'foo': 1}, {}, {'foo': 3}])
+    assert next(outputs) == '1'
+    with pytest.raises(NotFound):
+        next(outputs)
+    with pytest.raises(AssertionError):
+        next(render_many(cls, [{'getVar': 'lol'}]))
+    with pytest.raises(TypeError):
+        next(render_many(cls, [str('bar')]))
+    assert list(render_many(cls, [{'foo': 3}])) == ['3']
@@ -1,10 +1,27 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import ast
+
 import pytest
 
+from Cheetah import ast_utils
+from Cheetah.ast_utils import get_call_arguments
+from Cheetah.ast_utils import get_from_import
 from Cheetah.ast_utils import get_imported_names
 from Cheetah.ast_utils import get_lvalues
+from Cheetah.ast_utils import passes_self
+from Cheetah.ast_utils import parse_batch
+
+
+# pylint:disable=redefined-outer-name
+
+
+@pytest.yield_fixture
+def parse_cache():
+    ast_utils._parse_cache.clear()
+    yield ast_utils._parse_cache
+    ast_utils._parse_cache.clear()
 
 
 @pytest.mark.parametrize(
@@ -23,6 +40,60 @@ def test_get_imported_names(statement, expected):
     assert set(get_imported_names(statement)) == expected
 
 
+@pytest.mark.parametrize(
+    ('statement', 'expected'),
+    (
+        ('from foo import bar', ('foo', [('bar', 'bar')])),
+        (
+            'from foo.bar import baz as b, x',
+            ('foo.bar', [('baz', 'b'), ('x', 'x')]),
+        ),
+        ('from foo import *', ('foo', [])),
+        ('import foo', None),
+        ('from . import foo', None),
+        ('from .foo import bar', None),
+    )
+)
+def test_get_from_import(statement, expected):
+    assert get_from_import(statement) == expected
+
+
+@pytest.mark.parametrize(
+    ('call_args', 'expected'),
+    (
+        ('', (0, [])),
+        ('a, b(c, d=1)', (2, [])),
+        ('a, ttl=1', (1, ['ttl'])),
+        ('*a', (None, [])),
+        ('a, *b', (None, [])),
+        ('a, **b', (1, [None])),
+    ),
+)
+def test_get_call_arguments(call_args, expected):
+    assert get_call_arguments(call_args) == expected
+
+
+@pytest.mark.parametrize(
+    ('call', 'expected'),
+    (
+        ('()', False),
+        ('(x, self)', False),
+        ('(self.x)', False),
+        ('(_(self))', False),
+        ('(x)(self)', False),
+        ('(x=self)[0]', False),
+        ('(self)', True),
+        ('( self , x)', True),
+        ('(x, self=self)', True),
+        ('(self=self).y', True),
+        ('(*args)', True),
+        ('(x, **kwargs)', True),
+    ),
+)
+def test_passes_self(call, expected):
+    assert passes_self(call) is expected
+
+
 def test_get_lvalues_set():
     assert set(get_lvalues('x = 5')) == set(('x',))
 
@@ -69,3 +140,63 @@ def test_get_lvalues_exception_handler_no_as():
         '    pass\n'
     ))
     assert ret == set()
+
+
+def test_memoized(parse_cache, monkeypatch):
+    assert get_lvalues('x = 5') == ['x']
+    assert 'x = 5' in parse_cache
+
+    monkeypatch.setattr(ast, 'parse', None)
+    # The returned lists are not shared
+    get_lvalues('x = 5').append('y')
+    assert get_lvalues('x = 5') == ['x']
+
+
+def test_memo_is_bounded(parse_cache, monkeypatch):
+    monkeypatch.setattr(ast_utils, '_MAXCACHE', 2)
+    get_lvalues('x = 1')
+    get_lvalues('x = 2')
+    get_lvalues('x = 3')
+    assert set(parse_cache) == set(('x = 3',))
+
+
+def test_parse_batch(parse_cache, monkeypatch):
+    statements = [
+        'import foo, bar.baz',
+        'for x in y:\n    pass',
+        'a = 1; b = 2',
+        'for x in y:\n    pass',
+        'c = """\n"""',
+    ]
+    parse_batch(statements)
+    assert set(parse_cache) == set(statements)
+
+    monkeypatch.setattr(ast, 'parse', None)
+    assert get_imported_names('import foo, bar.baz') == ['foo', 'bar']
+    assert get_lvalues('for x in y:\n    pass') == ['x']
+    assert get_lvalues('a = 1; b = 2') == ['a', 'b']
+    assert get_lvalues('c = """\n"""') == ['c']
+    # Everything is already parsed
+    parse_batch(statements)
+
+
+@pytest.mark.parametrize('statements', (
+    # Not valid on their own but valid together
+    ('x = (1', ')'),
+    ('@decorator', 'def f(): pass'),
+    # Valid, but not at the start of its line
+    ('# comment\nx = 1', 'y = 2'),
+    # Invalid
+    ('x = 1', 'x ='),
+))
+def test_parse_batch_falls_back(parse_cache, statements):
+    parse_batch(statements)
+    for statement in statements:
+        try:
+            ast.parse(statement)
+        except SyntaxError:
+            assert statement not in parse_cache
+            with pytest.raises(SyntaxError):
+                get_lvalues(statement)
+        else:
+            assert statement in parse_cache
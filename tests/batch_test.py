@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import sys
+
+import pytest
+
+from Cheetah import batch
+from Cheetah.batch import BatchReport
+from Cheetah.batch import render_batch
+from Cheetah.batch import RenderResult
+from Cheetah.cheetah_compile import compile_all
+from Cheetah.NameMapper import NotFound
+
+
+# pylint:disable=redefined-outer-name
+
+
+@pytest.yield_fixture
+def batch_templates(tmpdir, monkeypatch):
+    pkg = tmpdir.join('batch_templates').ensure_dir()
+    pkg.join('hello.tmpl').write('Hello $name\n')
+    pkg.join('bye.tmpl').write('Bye $name\n')
+    pkg.join('defines_reset.tmpl').write(
+        '#def reset()\nreset\n#end def\n$reset() $name\n'
+    )
+    compile_all([pkg.strpath])
+    monkeypatch.syspath_prepend(tmpdir.strpath)
+    monkeypatch.setattr(batch, '_instances', {})
+    modules_before = set(sys.modules)
+    yield
+    for module_name in set(sys.modules) - modules_before:
+        del sys.modules[module_name]
+
+
+JOBS = [
+    ('batch_templates.hello', {'name': 'a'}),
+    ('batch_templates.bye', {'name': 'b'}),
+    ('batch_templates.hello', {'name': 'c'}),
+]
+
+
+@pytest.mark.parametrize('processes', (1, 2))
+def test_render_batch(batch_templates, processes):
+    report = BatchReport()
+    results = list(render_batch(
+        iter(JOBS), processes=processes, chunksize=1, report=report,
+    ))
+    assert [result[:3] for result in results] == [
+        (0, 'batch_templates.hello', 'Hello a\n'),
+        (1, 'batch_templates.bye', 'Bye b\n'),
+        (2, 'batch_templates.hello', 'Hello c\n'),
+    ]
+    assert report.renders == {
+        'batch_templates.hello': 2, 'batch_templates.bye': 1,
+    }
+    assert sorted(report.throughput()) == [
+        'batch_templates.bye', 'batch_templates.hello',
+    ]
+
+
+def test_render_batch_imports_once(batch_templates):
+    list(render_batch(JOBS, processes=1))
+    assert sorted(batch._instances) == [
+        'batch_templates.bye', 'batch_templates.hello',
+    ]
+    hello = batch._instances['batch_templates.hello']
+    assert hello.getVar('name', None) is None
+    list(render_batch(JOBS, processes=1))
+    assert batch._instances['batch_templates.hello'] is hello
+
+
+def test_render_batch_unordered(batch_templates):
+    results = render_batch(JOBS * 10, processes=2, chunksize=3, ordered=False)
+    outputs = sorted((result.index, result.output) for result in results)
+    assert outputs == list(enumerate(['Hello a\n', 'Bye b\n', 'Hello c\n'] * 10))
+
+
+def test_render_batch_error(batch_templates):
+    results = render_batch(
+        [('batch_templates.hello', {'name': 'a'}), ('batch_templates.bye', {})],
+        processes=2,
+        chunksize=1,
+    )
+    assert next(results).output == 'Hello a\n'
+    with pytest.raises(NotFound):
+        next(results)
+
+
+def test_render_batch_stop_early(batch_templates):
+    results = render_batch(JOBS * 100, processes=2)
+    assert next(results).output == 'Hello a\n'
+    results.close()
+
+
+def test_throughput():
+    report = BatchReport()
+    report.add(RenderResult(0, 'fast', '', 0.0))
+    report.add(RenderResult(1, 'slow', '', 0.5))
+    report.add(RenderResult(2, 'slow', '', 0.5))
+    assert report.throughput() == {'fast': float('inf'), 'slow': 2.0}
+
+
+def test_render_batch_template_defining_reset(batch_templates):
+    results = render_batch(
+        [('batch_templates.defines_reset', {'name': 'a'})], processes=1,
+    )
+    assert [result.output for result in results] == ['reset\n a\n']
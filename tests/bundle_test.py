@@ -0,0 +1,215 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os.path
+import sys
+import warnings
+
+import pytest
+
+from Cheetah.bundle import BundleImporter
+from Cheetah.bundle import install_bundle
+from Cheetah.bundle import write_bundle
+from Cheetah.cheetah_compile import compile_all
+from Cheetah.cheetah_compile import compile_bundle
+
+
+# pylint:disable=redefined-outer-name
+
+
+@pytest.yield_fixture
+def cleanup_imports():
+    meta_path_before = list(sys.meta_path)
+    modules_before = set(sys.modules)
+    yield
+    sys.meta_path[:] = meta_path_before
+    for module_name in set(sys.modules) - modules_before:
+        del sys.modules[module_name]
+
+
+@pytest.yield_fixture
+def template_tree(tmpdir):
+    pkg = tmpdir.join('bundled_templates').ensure_dir()
+    pkg.join('base.tmpl').write('Base: #block body\n#end block\n')
+    pkg.join('__pycache__').ensure_dir()
+    pkg.join('sub').ensure_dir().join('child.tmpl').write(
+        '#extends bundled_templates.base\n'
+        '#block body\nChild $thing\n#end block\n'
+    )
+    pkg.join('partial.tmpl').write(
+        '#extends Cheetah.partial_template\n'
+        '#def render(text)\nPartial $text\n#end def\n'
+    )
+    pkg.join('uses_partial.tmpl').write(
+        '#from bundled_templates.partial import render\n'
+        "$render('hi')\n"
+    )
+    with tmpdir.as_cwd():
+        yield tmpdir
+
+
+def test_compile_bundle(template_tree, cleanup_imports):
+    compile_all(['--bundle', 'templates.bundle', 'bundled_templates'])
+
+    # Nothing is written besides the bundle
+    assert template_tree.join('templates.bundle').check()
+    assert not template_tree.join('bundled_templates', 'base.py').check()
+    assert not template_tree.join('bundled_templates', '__init__.py').check()
+
+    importer = install_bundle('templates.bundle')
+    assert importer.module_names() == [
+        'bundled_templates',
+        'bundled_templates.base',
+        'bundled_templates.partial',
+        'bundled_templates.sub',
+        'bundled_templates.sub.child',
+        'bundled_templates.uses_partial',
+    ]
+
+    from bundled_templates.sub.child import YelpCheetahTemplate
+    assert YelpCheetahTemplate({'thing': 'x'}).respond() == 'Base: Child x\n'
+
+    from bundled_templates.uses_partial import YelpCheetahTemplate
+    assert YelpCheetahTemplate().respond() == 'Partial hi\n\n'
+
+
+def test_compile_bundle_existing_init(template_tree, cleanup_imports):
+    template_tree.join('bundled_templates', '__init__.py').write('X = 1\n')
+    compile_all(['--bundle', 'templates.bundle', 'bundled_templates'])
+
+    install_bundle('templates.bundle')
+    import bundled_templates
+    assert bundled_templates.X == 1
+
+
+def test_compile_bundle_single_files(template_tree):
+    report = []
+    compile_bundle(
+        (
+            os.path.join('bundled_templates', 'base.tmpl'),
+            # argv passes bytes in py2
+            os.path.join('bundled_templates', 'sub', 'child.tmpl').encode(
+                'UTF-8',
+            ),
+        ),
+        'templates.bundle',
+        report=report,
+    )
+
+    assert [stats['filename'] for stats in report] == [
+        os.path.join('bundled_templates', 'base.tmpl'),
+        os.path.join('bundled_templates', 'sub', 'child.tmpl'),
+    ]
+    assert 'write_seconds' not in report[0]
+    importer = BundleImporter('templates.bundle')
+    # With their parent packages
+    assert importer.module_names() == [
+        'bundled_templates',
+        'bundled_templates.base',
+        'bundled_templates.sub',
+        'bundled_templates.sub.child',
+    ]
+
+
+def test_compile_bundle_python_modules(
+        template_tree, cleanup_imports, monkeypatch,
+):
+    monkeypatch.syspath_prepend(template_tree.strpath)
+    pkg = template_tree.join('bundled_templates')
+    pkg.join('helpers.py').write('HELPER = 1\n')
+    pkg.join('sub', 'sub_helpers.py').write('SUB_HELPER = 2\n')
+    compile_all([
+        '--bundle', 'templates.bundle',
+        os.path.join('bundled_templates', 'base.tmpl'),
+        os.path.join('bundled_templates', 'sub', 'child.tmpl'),
+    ])
+    install_bundle('templates.bundle')
+
+    import bundled_templates.sub
+    assert bundled_templates.__path__ == [pkg.strpath]
+    assert bundled_templates.sub.__path__ == [pkg.join('sub').strpath]
+    # Modules which aren't in the bundle are imported from the filesystem
+    from bundled_templates.helpers import HELPER
+    from bundled_templates.sub.sub_helpers import SUB_HELPER
+    assert (HELPER, SUB_HELPER) == (1, 2)
+    from bundled_templates.sub.child import YelpCheetahTemplate
+    assert YelpCheetahTemplate({'thing': 'x'}).respond() == 'Base: Child x\n'
+
+
+def test_load_module_attributes(tmpdir, cleanup_imports):
+    bundle = tmpdir.join('b.bundle').strpath
+    write_bundle(bundle, {
+        'bundled_pkg': (True, 'X = 1\n'),
+        'bundled_pkg.mod': (False, 'from bundled_pkg import X\nY = X + 1\n'),
+    })
+    importer = install_bundle(bundle)
+
+    with warnings.catch_warnings():
+        # Not a legacy finder on python 3
+        warnings.simplefilter('error', ImportWarning)
+        import bundled_pkg.mod
+    assert bundled_pkg.mod.Y == 2
+    assert bundled_pkg.mod.__loader__ is importer
+    assert bundled_pkg.mod.__package__ == 'bundled_pkg'
+    assert bundled_pkg.mod.__file__ == os.path.join(
+        bundle, 'bundled_pkg', 'mod.py',
+    )
+    assert bundled_pkg.__path__ == []
+    assert bundled_pkg.__file__ == os.path.join(
+        bundle, 'bundled_pkg', '__init__.py',
+    )
+    assert importer.find_spec('not_bundled') is None
+    assert importer.find_module('not_bundled') is None
+
+
+def test_load_module(tmpdir, cleanup_imports):
+    # The python 2 loader
+    bundle = tmpdir.join('b.bundle').strpath
+    write_bundle(bundle, {
+        'bundled_pkg': (True, 'X = 1\n'),
+        'bundled_pkg.mod': (False, 'from bundled_pkg import X\nY = X + 1\n'),
+        'bundled_pkg.error': (False, '1 / 0\n'),
+    })
+    importer = BundleImporter(bundle)
+    assert importer.find_module('bundled_pkg.mod') is importer
+
+    bundled_pkg = importer.load_module('bundled_pkg')
+    assert sys.modules['bundled_pkg'] is bundled_pkg
+    assert bundled_pkg.__path__ == []
+    assert bundled_pkg.__package__ == 'bundled_pkg'
+    mod = importer.load_module('bundled_pkg.mod')
+    assert mod.Y == 2
+    assert mod.__loader__ is importer
+    assert mod.__package__ == 'bundled_pkg'
+    assert mod.__file__ == os.path.join(bundle, 'bundled_pkg', 'mod.py')
+    # Already imported modules are reused
+    assert importer.load_module('bundled_pkg.mod') is mod
+
+    with pytest.raises(ZeroDivisionError):
+        importer.load_module('bundled_pkg.error')
+    assert 'bundled_pkg.error' not in sys.modules
+
+
+def test_load_module_error_removes_module(tmpdir, cleanup_imports):
+    bundle = tmpdir.join('b.bundle').strpath
+    write_bundle(bundle, {'bundled_error': (False, '1 / 0\n')})
+    install_bundle(bundle)
+
+    with pytest.raises(ZeroDivisionError):
+        __import__('bundled_error')
+    assert 'bundled_error' not in sys.modules
+
+
+def test_not_a_bundle(tmpdir):
+    not_a_bundle = tmpdir.join('not.bundle')
+    with io.open(not_a_bundle.strpath, 'wb') as not_a_bundle_file:
+        not_a_bundle_file.write(b'lol')
+
+    with pytest.raises(ImportError) as excinfo:
+        BundleImporter(not_a_bundle.strpath)
+    assert excinfo.value.args == (
+        '{0} is not a bundle written by this version of python'.format(
+            not_a_bundle.strpath,
+        ),
+    )
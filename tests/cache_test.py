@@ -0,0 +1,296 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import socket
+import threading
+
+import pytest
+import six
+
+from Cheetah import cache
+from Cheetah.cache import FragmentCache
+from Cheetah.cache import LRUCache
+from Cheetah.cache import MemcachedCache
+from Cheetah.compile import compile_source
+from Cheetah.compile import compile_to_class
+from Cheetah.legacy_parser import ParseError
+
+
+# pylint:disable=redefined-outer-name
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache():
+    lru = LRUCache(maxsize=2)
+    assert lru.get('a') is None
+    lru.set('a', 'A')
+    lru.set('b', 'B')
+    assert (lru.get('a'), lru.get('b')) == ('A', 'B')
+    # 'a' is the least recently used
+    lru.set('c', 'C')
+    assert len(lru) == 2
+    assert (lru.get('a'), lru.get('b'), lru.get('c')) == (None, 'B', 'C')
+    # Setting again only replaces the value
+    lru.set('b', 'B2')
+    assert (lru.get('b'), lru.get('c')) == ('B2', 'C')
+    assert (lru.hits, lru.misses, lru.evictions) == (6, 2, 1)
+
+    lru.clear()
+    assert len(lru) == 0
+    assert lru.get('b') is None
+
+
+def test_lru_cache_ttl():
+    timer = FakeTimer()
+    lru = LRUCache(timer=timer)
+    lru.set('a', 'A', ttl=10)
+    lru.set('b', 'B')
+    timer.now = 9
+    assert lru.get('a') == 'A'
+    timer.now = 10
+    assert lru.get('a') is None
+    assert len(lru) == 1
+    timer.now = 1000
+    assert lru.get('b') == 'B'
+
+
+class FakeMemcachedHandler(six.moves.socketserver.StreamRequestHandler):
+    def handle(self):
+        data = self.server.data
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            self.server.requests.append(line)
+            command = line.split()
+            if command[0] == b'get' and command[1] == b'error':
+                self.wfile.write(b'ERROR\r\n')
+            elif command[0] == b'get' and command[1] != b'hangup':
+                if command[1] in data:
+                    value = data[command[1]]
+                    self.wfile.write(
+                        b'VALUE ' + command[1] + b' 0 ' +
+                        str(len(value)).encode('UTF-8') + b'\r\n' +
+                        value + b'\r\nEND\r\n'
+                    )
+                else:
+                    self.wfile.write(b'END\r\n')
+            elif command[0] == b'set':
+                value = self.rfile.read(int(command[4]) + 2)[:-2]
+                if command[1].endswith(b'bad'):
+                    self.wfile.write(b'SERVER_ERROR nope\r\n')
+                else:
+                    data[command[1]] = value
+                    self.wfile.write(b'STORED\r\n')
+            else:
+                return
+
+
+@pytest.yield_fixture
+def memcached_server():
+    server = six.moves.socketserver.ThreadingTCPServer(
+        ('127.0.0.1', 0), FakeMemcachedHandler,
+    )
+    server.daemon_threads = True
+    server.data = {}
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_memcached_cache(memcached_server):
+    client = MemcachedCache(memcached_server.server_address, prefix='t:')
+    try:
+        assert client.get(('ns', 'a')) is None
+        client.set(('ns', 'a'), '\u2603 \r\n value', ttl=30)
+        assert client.get(('ns', 'a')) == '\u2603 \r\n value'
+        assert (client.hits, client.misses, client.errors) == (1, 1, 0)
+    finally:
+        client.close()
+
+    key, = memcached_server.data
+    assert key.startswith(b't:') and len(key) == 42
+    assert memcached_server.requests[1] == (
+        b'set ' + key + b' 0 30 12\r\n'
+    )
+
+
+@pytest.mark.parametrize(
+    ('ttl', 'exptime'),
+    (
+        (None, b'0'),
+        (0.5, b'1'),
+        (30.2, b'31'),
+        (30 * 24 * 60 * 60, b'2592000'),
+        # Longer ttls are sent as unix timestamps
+        (30 * 24 * 60 * 60 + 1, b'1002592001'),
+    ),
+)
+def test_memcached_cache_exptime(memcached_server, ttl, exptime):
+    timer = FakeTimer()
+    timer.now = 1000000000
+    client = MemcachedCache(memcached_server.server_address, timer=timer)
+    client._key = lambda key: key.encode('UTF-8')
+    client.set('a', 'value', ttl=ttl)
+    client.close()
+    assert memcached_server.requests == [b'set a 0 ' + exptime + b' 5\r\n']
+
+
+def test_memcached_cache_expired_ttl(memcached_server):
+    client = MemcachedCache(memcached_server.server_address)
+    client.set('a', 'value', ttl=0)
+    client.set('a', 'value', ttl=-1)
+    client.close()
+    assert memcached_server.requests == []
+
+
+def test_memcached_cache_server_error(memcached_server):
+    client = MemcachedCache(memcached_server.server_address)
+    client._key = lambda key: key.encode('UTF-8')
+    client.set('bad', 'value')
+    assert client.errors == 1
+    # Reconnects after errors
+    client.set('good', 'value')
+    assert client.get('good') == 'value'
+    assert client.errors == 1
+    client.close()
+    client.close()
+
+
+def test_memcached_cache_connection_closed(memcached_server):
+    client = MemcachedCache(memcached_server.server_address)
+    client._key = lambda key: key.encode('UTF-8')
+    assert client.get('hangup') is None
+    assert client.get('error') is None
+    assert client.errors == 2
+
+
+def test_memcached_cache_unreachable():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    address = sock.getsockname()
+    sock.close()
+
+    client = MemcachedCache(address)
+    assert client.get('a') is None
+    client.set('a', 'value')
+    assert (client.misses, client.errors) == (1, 2)
+
+
+@pytest.yield_fixture
+def backend():
+    lru = LRUCache()
+    orig = cache.fragment_cache.backend
+    cache.fragment_cache.backend = lru
+    try:
+        yield lru
+    finally:
+        cache.fragment_cache.backend = orig
+
+
+def test_fragment_cache():
+    fragment_cache = FragmentCache(LRUCache())
+    fragment = fragment_cache.lookup('ns', (1, 1), 'key', ttl=5)
+    assert fragment.value is None
+    fragment.store('output')
+    assert fragment.value == 'output'
+    assert fragment_cache.lookup('ns', (1, 1), 'key').value == 'output'
+    assert fragment_cache.lookup('other', (1, 1), 'key').value is None
+    assert fragment_cache.lookup('ns', (2, 1), 'key').value is None
+
+
+CACHE_SRC = (
+    'Hello\n'
+    '#cache ($name, "card")\n'
+    '#py $rendered.append($name)\n'
+    'Card of $name\n'
+    '#end cache\n'
+    '#cache $name: short $name\n'
+)
+
+
+def test_cache_directive(backend):
+    cls = compile_to_class(CACHE_SRC)
+    rendered = []
+    for name in ('a', 'b', 'a'):
+        assert cls({'name': name, 'rendered': rendered}).respond() == (
+            'Hello\nCard of {0}\nshort {0}\n'.format(name)
+        )
+    assert rendered == ['a', 'b']
+    assert (backend.hits, backend.misses) == (2, 4)
+
+
+def test_cache_directive_ttl(backend):
+    timer = FakeTimer()
+    backend._timer = timer
+    cls = compile_to_class(
+        '#cache "key", ttl=$ttl\n$x\n#end cache\n',
+    )
+    assert cls({'x': 1, 'ttl': 10}).respond() == '1\n'
+    assert cls({'x': 2, 'ttl': 10}).respond() == '1\n'
+    timer.now = 10
+    assert cls({'x': 3, 'ttl': 10}).respond() == '3\n'
+
+
+def test_cache_directive_memcached(backend, memcached_server):
+    client = MemcachedCache(memcached_server.server_address)
+    cache.fragment_cache.backend = client
+    cls = compile_to_class('#cache "key"\n$x\n#end cache\n')
+    try:
+        assert cls({'x': 1}).respond() == '1\n'
+        assert cls({'x': 2}).respond() == '1\n'
+    finally:
+        client.close()
+    assert (client.hits, client.misses) == (1, 1)
+
+
+def test_cache_directive_regions_with_the_same_key(backend):
+    cls = compile_to_class(
+        '#cache "x": A\n'
+        '#cache "x"\nB\n#end cache\n'
+        '#def f()\n#cache "x": C\n#end def\n'
+        '$f()',
+    )
+    assert cls().respond() == 'A\nB\nC\n'
+    assert cls().respond() == 'A\nB\nC\n'
+    assert (backend.hits, backend.misses) == (3, 3)
+
+
+def test_cache_directive_imports_once():
+    src = compile_source(
+        '#cache 1\n#end cache\n#def f()\n#cache 2: x\n#end def\n',
+    )
+    assert src.count('import fragment_cache') == 1
+    assert 'fragment_cache' not in compile_source('#call foo\n#end call\n')
+
+
+@pytest.mark.parametrize(
+    ('src', 'msg'),
+    (
+        ('#cache\nfoo\n#end cache\n', '#cache requires a key'),
+        ('#cache 1:\nfoo\n', 'Some #directives are missing'),
+        ('#cache 1\nfoo\n#end call\n', '#end call found, expected #end cache'),
+        ('#cache $a, $b\nfoo\n#end cache\n', '#cache takes a key and an optional ttl'),
+        ('#cache 1, foo=2: foo\n', '#cache takes a key and an optional ttl'),
+        ('#cache ttl=1: foo\n', '#cache takes a key and an optional ttl'),
+        ('#cache *a: foo\n', '#cache takes a key and an optional ttl'),
+        ('#cache 1, **a: foo\n', '#cache takes a key and an optional ttl'),
+    ),
+)
+def test_cache_directive_errors(src, msg):
+    with pytest.raises(ParseError) as excinfo:
+        compile_source(src)
+    assert msg in str(excinfo.value)
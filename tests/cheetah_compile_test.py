@@ -2,15 +2,20 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import io
+import json
 import os.path
+import sys
 
 import pytest
 
 from Cheetah.cheetah_compile import _compile_files_in_directory
 from Cheetah.cheetah_compile import _touch_init_if_not_exists
+from Cheetah.cheetah_compile import check_template
+from Cheetah.cheetah_compile import check_templates
 from Cheetah.cheetah_compile import compile_all
 from Cheetah.cheetah_compile import compile_directories
 from Cheetah.cheetah_compile import compile_template
+from Cheetah.cheetah_compile import compile_worker
 from testing.util import run_python
 
 
@@ -71,6 +76,210 @@ def test_compile_multiple_files_by_directory(template_writer, tmpdir):
     assert run_python(tmpl2.replace('.tmpl', '.py')) == 'bar'
 
 
+def _assert_report(report, filenames):
+    assert [stats['filename'] for stats in report] == filenames
+    for stats in report:
+        assert set(stats) == {
+            'filename',
+            'parse_seconds', 'codegen_seconds', 'write_seconds',
+            'source_bytes', 'generated_bytes',
+            'placeholders', 'directives', 'vffsl_sites',
+            'namespace_names', 'extends',
+        }
+
+
+def test_compile_template_report(template_writer):
+    tmpl = template_writer.write('$foo')
+    report = []
+    compile_template(tmpl, report=report)
+    _assert_report(report, [tmpl])
+    assert report[0]['placeholders'] == 1
+    assert report[0]['vffsl_sites'] == 1
+    assert report[0]['namespace_names'] == ['foo']
+    assert report[0]['source_bytes'] == 4
+
+
+def test_compile_all_report_file(template_writer, tmpdir):
+    tmpl1 = template_writer.write('foo')
+    tmpl2 = template_writer.write('#if True\nbar\n#end if\n')
+    report_file = tmpdir.join('report.json').strpath
+    compile_all([
+        '--report', 'json', '--report-file', report_file, tmpdir.strpath,
+    ])
+    report = json.loads(io.open(report_file).read())
+    _assert_report(
+        sorted(report, key=lambda stats: stats['filename']), [tmpl1, tmpl2],
+    )
+    assert run_python(tmpl1.replace('.tmpl', '.py')) == 'foo'
+
+
+def test_compile_all_report_stdout(template_writer, capsys):
+    tmpl = template_writer.write('foo')
+    compile_all(['--report', 'json', tmpl])
+    out, err = capsys.readouterr()
+    # The progress goes to stderr
+    assert err == 'Compiling {0}\n'.format(tmpl)
+    report = json.loads(out)
+    _assert_report(report, [tmpl])
+
+
+def test_compile_all_report_stdout_directory(tmpdir, capsys):
+    tmpdir.join('a.tmpl').write('foo')
+    compile_all(['--report', 'json', tmpdir.strpath])
+    out, err = capsys.readouterr()
+    assert err == 'Compiling {0}\nCreating {1}\n'.format(
+        tmpdir.join('a.tmpl').strpath, tmpdir.join('__init__.py').strpath,
+    )
+    _assert_report(json.loads(out), [tmpdir.join('a.tmpl').strpath])
+
+
+def test_compile_all_report_stdout_bundle(tmpdir, capsys):
+    tmpdir.join('a.tmpl').write('foo')
+    with tmpdir.as_cwd():
+        compile_all(['--report', 'json', '--bundle', 'a.bundle', 'a.tmpl'])
+    out, err = capsys.readouterr()
+    assert err == 'Compiling a.tmpl\nWriting a.bundle\n'
+    report, = json.loads(out)
+    assert report['filename'] == 'a.tmpl'
+
+
+def test_compile_worker(template_writer, tmpdir):
+    tmpl1 = template_writer.write('foo')
+    tmpl2 = template_writer.write('$foo\n#end if\n')
+    target = tmpdir.join('out.py').strpath
+    requests = io.StringIO(
+        '\n'.join(
+            json.dumps(request) for request in (
+                {'id': 1, 'source': tmpl1},
+                {'id': 2, 'source': tmpl2},
+                {'source': tmpl2.replace('.tmpl', '.nope')},
+                {
+                    'id': 'with-settings',
+                    'source': tmpl1,
+                    'target': target,
+                    'settings': {'useNameMapper': False},
+                },
+            )
+        ) + '\n\n'
+    )
+    responses = io.StringIO()
+
+    compile_worker(requests, responses)
+
+    response1, response2, response3, response4 = [
+        json.loads(line) for line in responses.getvalue().splitlines()
+    ]
+    assert response1 == {'id': 1, 'target': tmpl1.replace('.tmpl', '.py')}
+    assert run_python(response1['target']) == 'foo'
+    assert response2['id'] == 2
+    assert response2['error_type'] == 'ParseError'
+    assert '#end found, but nothing to end' in response2['error']
+    assert response3['id'] is None
+    assert response3['error_type'] in ('IOError', 'FileNotFoundError')
+    assert response4 == {'id': 'with-settings', 'target': target}
+    assert run_python(target) == 'foo'
+
+
+def test_compile_worker_malformed_requests(template_writer):
+    tmpl = template_writer.write('foo')
+    requests = io.StringIO(
+        '{"source": \n' +
+        '["not", "an", "object"]\n' +
+        '{"id": 1}\n' +
+        json.dumps({'id': 2, 'source': tmpl}) + '\n'
+    )
+    responses = io.StringIO()
+
+    compile_worker(requests, responses)
+
+    response1, response2, response3, response4 = [
+        json.loads(line) for line in responses.getvalue().splitlines()
+    ]
+    assert response1['id'] is None
+    assert response1['error_type'] in ('ValueError', 'JSONDecodeError')
+    assert response2['id'] is None
+    assert response2['error_type'] == 'ValueError'
+    assert 'Expected a json object' in response2['error']
+    assert response3['id'] == 1
+    assert response3['error_type'] == 'KeyError'
+    # The worker is still alive
+    assert response4 == {'id': 2, 'target': tmpl.replace('.tmpl', '.py')}
+
+
+def test_compile_all_worker(template_writer, capsys, monkeypatch):
+    tmpl = template_writer.write('foo')
+    monkeypatch.setattr(
+        sys, 'stdin', io.StringIO(json.dumps({'source': tmpl}) + '\n'),
+    )
+    compile_all(['--worker'])
+    out, _ = capsys.readouterr()
+    assert json.loads(out) == {
+        'id': None, 'target': tmpl.replace('.tmpl', '.py'),
+    }
+
+
+def test_check_template(template_writer):
+    assert check_template(template_writer.write('Hello $world')) is None
+    tmpl = template_writer.write('Hello\n  #end if\n')
+    # argv passes bytes in py2
+    assert check_template(tmpl.encode('UTF-8')) == (
+        '{0}:2:10: #end found, but nothing to end'.format(tmpl)
+    )
+
+
+@pytest.mark.parametrize(
+    ('src', 'error'),
+    (
+        # Errors found while compiling the parsed template
+        ('#import 1\n', '1:10: SyntaxError: invalid syntax'),
+        ('#for x in\n#end for\n', '2:1: SyntaxError: invalid syntax'),
+    ),
+)
+def test_check_template_compile_errors(template_writer, src, error):
+    tmpl = template_writer.write(src)
+    assert check_template(tmpl).startswith('{0}:{1}'.format(tmpl, error))
+
+
+def test_check_template_unreadable(tmpdir):
+    not_utf8 = tmpdir.join('not_utf8.tmpl')
+    not_utf8.write_binary(b'\xff\n')
+    assert check_template(not_utf8.strpath).startswith(
+        '{0}: UnicodeDecodeError: '.format(not_utf8.strpath),
+    )
+    missing = tmpdir.join('missing.tmpl').strpath
+    error = check_template(missing)
+    assert error.startswith('{0}: '.format(missing))
+    assert error.split(': ')[1] in ('IOError', 'FileNotFoundError')
+
+
+def test_check_templates(tmpdir):
+    tmpdir.join('a.tmpl').write('#if True\n')
+    tmpdir.join('b.tmpl').write('ok\n')
+    tmpdir.join('sub').ensure_dir().join('c.tmpl').write('$foo(\n')
+    tmpdir.join('sub', 'd.txt').write('#if True\n')
+    # Doesn't stop the others from being checked
+    tmpdir.join('sub', 'e.tmpl').write_binary(b'\xff\n')
+    errors = check_templates((tmpdir.strpath,), processes=2)
+    assert [error.split(':', 1)[0] for error in errors] == [
+        tmpdir.join('a.tmpl').strpath,
+        tmpdir.join('sub', 'c.tmpl').strpath,
+        tmpdir.join('sub', 'e.tmpl').strpath,
+    ]
+    assert errors == check_templates((tmpdir.strpath,), processes=1)
+    # Nothing was written
+    assert not tmpdir.join('b.py').check()
+
+
+def test_compile_all_check(template_writer, capsys):
+    good = template_writer.write('Hello world')
+    assert compile_all(['--check', '--jobs', '1', good]) == 0
+    bad = template_writer.write('$foo(\n')
+    assert compile_all(['--check', '--jobs', '1', good, bad]) == 1
+    out, _ = capsys.readouterr()
+    assert out.startswith('{0}:'.format(bad))
+    assert not os.path.exists(good.replace('.tmpl', '.py'))
+
+
 def test_touch_init_if_not_exists(tmpdir):
     _touch_init_if_not_exists(tmpdir.strpath)
     assert os.path.exists(os.path.join(tmpdir.strpath, '__init__.py'))
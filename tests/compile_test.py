@@ -189,6 +189,28 @@ def test_compile_source_follows_settings():
         compile_to_class(tmpl, settings={'useLegacyImportMode': True})
 
 
+def test_compile_source_stats():
+    stats = {}
+    ret = compile_source(
+        '#import os\n$foo $bar.baz $os.path.sep\n#if $foo\nx\n#end if\n',
+        stats=stats,
+    )
+    assert ret == compile_source(
+        '#import os\n$foo $bar.baz $os.path.sep\n#if $foo\nx\n#end if\n',
+    )
+    assert stats.pop('parse_seconds') >= 0
+    assert stats.pop('codegen_seconds') >= 0
+    assert stats == {
+        'placeholders': 3,
+        'directives': 3,
+        'vffsl_sites': 3,
+        'source_bytes': 57,
+        'generated_bytes': len(ret.encode('UTF-8')),
+        'namespace_names': ['bar', 'foo'],
+        'extends': None,
+    }
+
+
 def test_compile_file_filename_requires_text():
     with pytest.raises(TypeError):
         compile_file(b'not_text.tmpl')
@@ -226,6 +248,13 @@ def test_compile_file_destination(tmpfile, tmpdir):
     assert "write('''Hello, world!''')" in python_file_contents
 
 
+def test_compile_file_stats(tmpfile):
+    stats = {}
+    compile_file(tmpfile, stats=stats)
+    assert stats['write_seconds'] >= 0
+    assert stats['source_bytes'] == len('Hello, world!')
+
+
 def test_compile_file_as_script(tmpfile):
     subprocess.check_call(['cheetah-compile', tmpfile])
     pyfile = tmpfile.replace('.tmpl', '.py')
@@ -372,6 +401,11 @@ Hello world
 #end call
 
 
+#cache 'mega_template_cache', ttl=60
+Cached $self.spacer()
+#end cache
+
+
 #py foo = {"a": 1}
 #del foo['a']
 $foo
@@ -1,9 +1,91 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import markupsafe
+import pytest
+
+from Cheetah import filters
 from Cheetah.compile import compile_to_class
 
 
+class HasHtml(object):
+    def __html__(self):
+        return '<b>html</b>'
+
+    def __str__(self):
+        return '<b>str</b>'
+
+    __unicode__ = __str__
+
+
+class TextSubclass(type('')):
+    pass
+
+
+class HtmlText(type('')):
+    def __html__(self):
+        return '<i>{0}</i>'.format(self)
+
+
+FILTER_VALUES = (
+    None,
+    '',
+    'plain text',
+    '<a href="x">\'Tom\' & "Jerry"</a>',
+    '&&<<>>""\'\'',
+    '\u2603 <snowman> \u2603',
+    '\U0001f600 & \xe9',
+    '\xe9<',
+    b'bytes <',
+    b'caf\xc3\xa9 &',
+    markupsafe.Markup('<b>markup</b>'),
+    markupsafe.Markup('&amp;'),
+    0,
+    -12345,
+    2 ** 80,
+    True,
+    1.5,
+    HasHtml(),
+    TextSubclass('<text subclass>'),
+    HtmlText('<html text>'),
+    object,
+)
+
+impls = pytest.mark.parametrize(
+    ('unicode_filter', 'markup_filter'),
+    (
+        (filters.py_unicode_filter, filters.py_markup_filter),
+        (filters.unicode_filter, filters.markup_filter),
+    ),
+)
+
+
+@impls
+@pytest.mark.parametrize('value', FILTER_VALUES)
+def test_unicode_filter(unicode_filter, markup_filter, value):
+    expected = filters.py_unicode_filter(value)
+    ret = unicode_filter(value)
+    assert type(ret) is type(expected)
+    assert ret == expected
+
+
+@impls
+@pytest.mark.parametrize('value', FILTER_VALUES)
+def test_markup_filter(unicode_filter, markup_filter, value):
+    expected = markupsafe.escape(filters.py_unicode_filter(value))
+    ret = markup_filter(value)
+    assert type(ret) is markupsafe.Markup
+    assert ret == expected
+
+
+@impls
+def test_filters_invalid_bytes(unicode_filter, markup_filter):
+    with pytest.raises(UnicodeDecodeError):
+        unicode_filter(b'\xff')
+    with pytest.raises(UnicodeDecodeError):
+        markup_filter(b'\xff')
+
+
 def render_tmpl(template_source):
     scope = dict(
         # Dummy variable
@@ -46,3 +128,11 @@ def test_transactional_filtering_naive_call():
     """)
     expected = '<2> [<1>bar</1>] </2>'
     assert output == expected
+
+
+@impls
+def test_markup_filter_html_of_non_text_unused(unicode_filter, markup_filter):
+    # Values which aren't text are converted to text before escaping
+    value = HasHtml()
+    assert value.__html__() == '<b>html</b>'
+    assert markup_filter(value) == '&lt;b&gt;str&lt;/b&gt;'
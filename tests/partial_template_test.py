@@ -1,19 +1,42 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import cProfile
+import sys
+import types
+
 import pytest
 
+from Cheetah.compile import compile_source
+from Cheetah.compile import compile_to_class
+from Cheetah.DummyTransaction import DummyTransaction
+from Cheetah.partial_template import c_default_self
 from Cheetah.partial_template import default_self
+from Cheetah.partial_template import memoize
 from Cheetah.partial_template import PartialMethodNotCalledFromTemplate
+from Cheetah.partial_template import py_default_self
 from Cheetah.Template import Template
 
 
-@default_self
-def decorated_function(self, *args):
+# pylint:disable=redefined-outer-name
+
+
+def _function(self, *args):
     self.template_method()
     return (self,) + args
 
 
+decorated_function = default_self(_function)
+
+
+@pytest.yield_fixture(autouse=True, params=(py_default_self, c_default_self))
+def default_self_impl(request):
+    global decorated_function  # pylint:disable=global-statement
+    decorated_function = request.param(_function)
+    yield request.param
+    decorated_function = default_self(_function)
+
+
 class TestCallMixin(object):
     """Mixin defining the methods that will be called in the test to validate
     the instances.
@@ -40,6 +63,9 @@ class TemplateClass(Template, TestCallMixin):
     def template_method(self):
         pass
 
+    def call_function(self, func, *args):
+        return func(*args)
+
 
 @pytest.mark.parametrize(
     'method',
@@ -104,6 +130,60 @@ def test_method_with_non_standard_first_argument():
         TemplateWithWeirdParameter().weird_first_argument()
 
 
+def test_default_self_wrapped(default_self_impl):
+    assert decorated_function.__wrapped__ is _function
+    assert decorated_function.__name__ == '_function'
+    assert decorated_function.__module__ == __name__
+
+
+def test_default_self_self_keyword():
+    instance = TemplateClass()
+    assert decorated_function(self=instance) == (instance,)
+    assert decorated_function(instance, 1) == (instance, 1)
+
+
+def test_default_self_non_template_self_keyword():
+    self = TemplateClass()
+    # The non-template is passed on as the first argument
+    assert decorated_function(self=1) == (self, 1)
+
+
+def test_default_self_template_class_with_same_name(default_self_impl):
+    def func(self, *args):
+        return (self,) + args
+    func.__name__ = str('TemplateClass')
+    decorated = default_self_impl(func)
+
+    instance = TemplateClass()
+    # The template class itself is discarded, like a missing self
+    assert instance.call_function(decorated, TemplateClass, 1) == (
+        instance, 1,
+    )
+    assert instance.call_function(decorated, Template, 1) == (
+        instance, Template, 1,
+    )
+
+
+def test_default_self_error_with_template_self():
+    with pytest.raises(AttributeError):
+        decorated_function(Template())
+
+
+def test_default_self_counts_calls_when_profiling():
+    instance = TemplateClass()
+    decorated_function(instance)
+    assert decorated_function.calls == 0
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        decorated_function(instance)
+        decorated_function(instance)
+    finally:
+        profile.disable()
+    assert decorated_function.calls == 2
+
+
 def test_partial_template_integration():
     from testing.templates.src.uses_partial import YelpCheetahTemplate
     ret = YelpCheetahTemplate().respond()
@@ -127,3 +207,174 @@ def test_partial_with_same_name_retains_class_and_keeps_function():
     assert partial_with_same_name.partial_with_same_name(
         Template()
     ) == '    Hello world\n'
+
+
+PARTIAL_CALLS_SRC = (
+    '#from testing.templates.src.partial_template import render\n'
+    '#from testing.templates.src.partial_template_no_arguments '
+    'import render as render_no_args\n'
+    "$render('a')\n"
+    "$render(self, 'b')\n"
+    "$render(self=self, text='c')\n"
+    '$render_no_args( )\n'
+)
+
+
+DIRECT_PARTIAL_CALLS = {'directPartialCalls': True}
+
+
+def test_partial_calls_pass_self_explicitly():
+    src = compile_source(PARTIAL_CALLS_SRC, settings=DIRECT_PARTIAL_CALLS)
+    assert "render.__wrapped__(self, 'a')" in src
+    assert "render(self, 'b')" in src
+    assert "render(self=self, text='c')" in src
+    assert 'render_no_args.__wrapped__(self )' in src
+
+    cls = compile_to_class(PARTIAL_CALLS_SRC, settings=DIRECT_PARTIAL_CALLS)
+    assert cls().respond() == (
+        '    From partial: a\n\n'
+        '    From partial: b\n\n'
+        '    From partial: c\n\n'
+        '    Look ma, no arguments!\n\n'
+    )
+
+
+def test_partial_calls_through_wrapper_by_default():
+    src = compile_source(PARTIAL_CALLS_SRC)
+    assert '__wrapped__' not in src
+    assert compile_to_class(PARTIAL_CALLS_SRC)().respond() == compile_to_class(
+        PARTIAL_CALLS_SRC, settings=DIRECT_PARTIAL_CALLS,
+    )().respond()
+
+
+@pytest.mark.parametrize(
+    'src',
+    (
+        # Not called
+        '#from testing.templates.src.partial_template import render\n'
+        '$render.__name__\n',
+        # Shadowed by a local
+        '#from testing.templates.src.partial_template import render\n'
+        '#def f(render)\n$render(1)\n#end def\n',
+        # Not a partial template
+        '#from os.path import join\n$join(1)\n',
+        # Not a function of the partial template
+        '#from testing.templates.src.partial_template import NO_CONTENT\n'
+        '$NO_CONTENT()\n',
+        # Rebound by a later import
+        '#from testing.templates.src.partial_template import render\n'
+        '#from os.path import basename as render\n'
+        '$render(1)\n',
+        # Not importable while compiling
+        '#from not_a_module import render\n$render(1)\n',
+        '#import os\n$os.path.join(1)\n',
+    ),
+)
+def test_no_direct_partial_calls(src):
+    assert '__wrapped__' not in compile_source(
+        src, settings=DIRECT_PARTIAL_CALLS,
+    )
+
+
+MEMOIZED_PARTIAL_SRC = (
+    '#extends Cheetah.partial_template\n'
+    '#from Cheetah.partial_template import memoize\n'
+    '#@memoize(maxsize=2)\n'
+    '#def render(x, suffix="")\n'
+    '#py $calls.append($x)\n'
+    '<$x$suffix>\n'
+    '#end def\n'
+    '#@memoize()\n'
+    '#def compute(x)\n'
+    '#return $x * 2\n'
+    '#end def\n'
+)
+
+
+@pytest.yield_fixture
+def memoized_partial():
+    module = types.ModuleType(str('memoized_partial'))
+    sys.modules[module.__name__] = module
+    try:
+        exec(compile_source(MEMOIZED_PARTIAL_SRC), module.__dict__)
+        yield module
+    finally:
+        del sys.modules[module.__name__]
+
+
+def test_memoize_renders_once(memoized_partial):
+    calls = []
+    cls = compile_to_class(
+        '#from memoized_partial import render\n'
+        '#for _ in range(200)\n'
+        '$render(1)#slurp\n'
+        '#end for\n'
+        '$render(2, suffix="!")$render(2, suffix="!")\n',
+    )
+    assert cls({'calls': calls}).respond() == '<1>\n' * 200 + '<2!>\n<2!>\n\n'
+    assert calls == [1, 2]
+    cache = memoized_partial.render.__wrapped__.cache
+    assert (cache.hits, cache.misses) == (200, 2)
+
+    # Calls from outside of a template return the output
+    other_calls = []
+    assert memoized_partial.render(Template({'calls': other_calls}), 1) == (
+        '<1>\n'
+    )
+    assert other_calls == []
+    # Bounded
+    memoized_partial.render(Template({'calls': calls}), 3)
+    assert cache.evictions == 1
+
+
+def test_memoize_return_value(memoized_partial):
+    template = Template()
+    assert memoized_partial.compute(template, 2) == 4
+    assert memoized_partial.compute(template, 2) == 4
+    cache = memoized_partial.compute.__wrapped__.cache
+    assert (cache.hits, cache.misses) == (1, 1)
+    template.transaction = DummyTransaction()
+    assert memoized_partial.compute(template, 2) == 4
+    assert template.transaction.getvalue() == ''
+
+
+def test_memoize_unhashable_arguments():
+    calls = []
+
+    @memoize()
+    def func(self, x):
+        calls.append(x)
+        return x
+
+    template = Template()
+    assert func(template, [1]) == [1]
+    assert func(template, [1]) == [1]
+    assert func(template, x=[1]) == [1]
+    assert calls == [[1], [1], [1]]
+    assert func.bypassed == 3
+    assert func.cache.misses == 0
+
+
+def test_memoize_typed_arguments():
+    cls = compile_to_class(
+        '#from Cheetah.partial_template import memoize\n'
+        '#@memoize()\n'
+        '#def show(x)\n'
+        '$repr($x)#slurp\n'
+        '#end def\n'
+        '$show(1) $show(True) $show(1.0) $show(x=1) $show(x=True) $show(1)\n',
+    )
+    assert cls().respond() == '1 True 1.0 1 True 1\n'
+    assert (cls.show.cache.hits, cls.show.cache.misses) == (1, 5)
+
+
+def test_memoize_restores_transaction_on_error():
+    @memoize()
+    def func(self):
+        raise ValueError()
+
+    template = Template()
+    transaction = template.transaction = DummyTransaction()
+    with pytest.raises(ValueError):
+        func(template)
+    assert template.transaction is transaction
@@ -0,0 +1,44 @@
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import gc
+
+import mock
+
+import testing.templates
+from Cheetah.preload import is_template_module
+from Cheetah.preload import preload_templates
+from Cheetah.Template import Template
+from testing.templates import extends_test_template
+from testing.templates.src import uses_partial
+
+
+def test_is_template_module():
+    assert is_template_module(uses_partial)
+    assert not is_template_module(extends_test_template)
+
+
+def test_preload_templates():
+    warmed = []
+    report = preload_templates(
+        [testing.templates], warm_func=warmed.append, freeze=False,
+    )
+    assert report.modules == 10
+    assert report.templates == 7
+    assert report.seconds > 0
+    assert report.max_rss_kb >= 0
+    assert report.frozen_objects == 0
+
+    assert len(warmed) == 7
+    assert all(issubclass(cls, Template) for cls in warmed)
+    assert uses_partial.YelpCheetahTemplate in warmed
+
+
+def test_preload_templates_freezes():
+    with mock.patch.object(gc, 'freeze', create=True) as freeze_mock:
+        with mock.patch.object(
+                gc, 'get_freeze_count', create=True, return_value=9001,
+        ):
+            report = preload_templates([testing.templates])
+    assert freeze_mock.call_count == 1
+    assert report.frozen_objects == 9001